@@ -3,11 +3,15 @@ import logging
 import os
 import json
 from dotenv import load_dotenv
-from livekit.agents import AutoSubscribe, JobContext, WorkerOptions, cli
-from livekit.agents.voice import Agent, AgentSession
+from livekit.agents import AutoSubscribe, JobContext, JobExecutorType, JobProcess, StopResponse, WorkerOptions, cli, stt
+from livekit.agents.voice import Agent, AgentSession, ModelSettings
 from livekit.plugins import deepgram, openai, silero
 from livekit.agents.llm import ChatContext, ChatMessage
 from livekit import rtc
+from llm_scheduler import Priority, create_llm_client
+from local_stt_plugin import LocalSTT, get_engine, is_available as local_stt_available
+from session_archive import open_session
+from turn_gate import create_turn_gate
 
 # Load environment variables from .env file
 load_dotenv()
@@ -23,6 +27,71 @@ if not os.getenv('GROQ_API_KEY'):
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class OnboardingAgent(Agent):
+    """Agent that makes one gate decision per user turn.
+
+    Accepted turns are handed to on_user_turn (chat publish, archive) and answered;
+    rejected ones skip the LLM and TTS and are never shown, so the chat always
+    matches what the LLM saw.
+    """
+    
+    def __init__(self, *, turn_gate, on_user_turn, **kwargs):
+        super().__init__(**kwargs)
+        self._turn_gate = turn_gate
+        self._on_user_turn = on_user_turn
+    
+    async def on_user_turn_completed(self, turn_ctx: ChatContext, new_message: ChatMessage):
+        text = new_message.text_content or ""
+        decision = self._turn_gate.evaluate(text)
+        if decision.suppressed:
+            logger.info(f"[GATE] Suppressed {decision.reason} turn: {text!r}")
+            raise StopResponse()
+        self._on_user_turn(text)
+    
+    async def tts_node(self, text, model_settings: ModelSettings):
+        """Feed the turn gate each reply as it goes to TTS.
+        
+        conversation_item_added only fires after playout, too late for echo checks on
+        the utterance being played.
+        """
+        async def capture(text):
+            self._turn_gate.start_agent_speech()
+            async for chunk in text:
+                self._turn_gate.add_agent_speech(chunk)
+                yield chunk
+        
+        async for frame in Agent.default.tts_node(self, capture(text), model_settings):
+            yield frame
+
+def stt_provider():
+    """STT_PROVIDER: deepgram (default), local, or fallback (Deepgram, then local)"""
+    provider = os.getenv('STT_PROVIDER', 'deepgram')
+    if provider in ('local', 'fallback') and not local_stt_available():
+        logger.error(
+            f"[STT] STT_PROVIDER={provider} needs faster-whisper "
+            f"(pip install -r requirements-local-stt.txt) - using Deepgram only"
+        )
+        return 'deepgram'
+    return provider
+
+def create_stt(provider, vad):
+    if provider == 'local':
+        return LocalSTT(vad=vad)
+    if provider == 'fallback':
+        return stt.FallbackAdapter([deepgram.STT(), LocalSTT(vad=vad)])
+    return deepgram.STT()
+
+def prewarm(proc: JobProcess):
+    """Load the local speech model before the first call instead of during it"""
+    provider = stt_provider()
+    if provider in ('local', 'fallback'):
+        try:
+            get_engine().load()
+        except Exception as e:
+            logger.error(f"[STT] Failed to load the local speech model, using Deepgram only: {e}")
+            provider = 'deepgram'
+    proc.userdata["stt_provider"] = provider
+
 async def entrypoint(ctx: JobContext):
     """Main entry point for the voice agent"""
     logger.info(f"Starting voice agent for room: {ctx.room.name}")
@@ -41,8 +110,37 @@ async def entrypoint(ctx: JobContext):
     # Store room reference
     room = ctx.room
     
+    # Filters fillers, backchannels and echo before they reach the LLM
+    turn_gate = create_turn_gate()
+    
+    # Archive turns and extracted fields off the hot path; written when the job shuts down
+    recorder = open_session(room.name)
+    
+    def on_user_turn(text):
+        """Publish and archive a user turn the gate accepted"""
+        logger.info(f"[USER] {text}")
+        recorder.record_turn("user", text)
+        
+        async def publish_user_message():
+            try:
+                await room.local_participant.publish_data(
+                    json.dumps({"action": "user_message", "text": text}).encode('utf-8'),
+                    reliable=True,
+                    topic="chat"
+                )
+                logger.info("[PUBLISHED] User message")
+            except Exception as e:
+                logger.error(f"[ERROR] Failed to publish user message: {e}")
+        
+        asyncio.create_task(publish_user_message())
+    
+    # One VAD for turn detection and for endpointing the local STT stream
+    vad = silero.VAD.load()
+    
     # Create the voice agent
-    agent = Agent(
+    agent = OnboardingAgent(
+        turn_gate=turn_gate,
+        on_user_turn=on_user_turn,
         instructions=(
             "You are a friendly onboarding assistant for Veltro, a business management platform. "
             "Your job is to help users set up their business by collecting information through natural conversation.\n\n"
@@ -96,12 +194,12 @@ async def entrypoint(ctx: JobContext):
             
             "After ALL steps are confirmed, say: 'Perfect! Your business is all set up. You can now launch your dashboard!'\n"
         ),
-        vad=silero.VAD.load(),
-        stt=deepgram.STT(),
+        vad=vad,
+        stt=create_stt(ctx.proc.userdata["stt_provider"], vad),
         llm=openai.LLM(
             model="llama-3.1-8b-instant",  # Smaller, faster model with higher limits
-            api_key=groq_api_key,
-            base_url="https://api.groq.com/openai/v1"
+            # Requests go through the worker-wide scheduler so rooms share one Groq budget
+            client=create_llm_client(api_key=groq_api_key, room=room.name, priority=Priority.INTERACTIVE),
         ),
         tts=deepgram.TTS(model="aura-asteria-en"),
     )
@@ -109,29 +207,39 @@ async def entrypoint(ctx: JobContext):
     # Create the agent session
     session = AgentSession()
     
+    async def close_recorder():
+        recorder.close()
+    
+    ctx.add_shutdown_callback(close_recorder)
+    
+    async def log_gate_stats():
+        logger.info(f"[GATE] Session stats: {json.dumps(turn_gate.stats())}")
+    
+    ctx.add_shutdown_callback(log_gate_stats)
+    
     # Store the last AI message to avoid duplicates
     last_ai_message = {"text": ""}
     
     # Hook into session events to capture transcripts
     @session.on("user_input_transcribed")
     def on_user_input_transcribed(event):
-        """Capture user's speech transcription"""
+        """Log user's speech transcription - whole turns are published from OnboardingAgent"""
         if event.is_final and event.transcript.strip():
-            text = event.transcript
-            logger.info(f"[USER] {text}")
-            
-            async def publish_user_message():
-                try:
-                    await room.local_participant.publish_data(
-                        json.dumps({"action": "user_message", "text": text}).encode('utf-8'),
-                        reliable=True,
-                        topic="chat"
-                    )
-                    logger.info("[PUBLISHED] User message")
-                except Exception as e:
-                    logger.error(f"[ERROR] Failed to publish user message: {e}")
-            
-            asyncio.create_task(publish_user_message())
+            logger.info(f"[TRANSCRIPT] {event.transcript}")
+    
+    @session.on("user_state_changed")
+    def on_user_state_changed(event):
+        """Response latency is measured from the end of the user's speech"""
+        if event.old_state == "speaking" and event.new_state == "listening":
+            recorder.mark_user_stopped_speaking()
+    
+    @session.on("agent_state_changed")
+    def on_agent_state_changed(event):
+        """Echo of the agent's own voice can only arrive while it speaks or just after"""
+        speaking = event.new_state == "speaking"
+        turn_gate.set_agent_speaking(speaking)
+        if speaking:
+            recorder.mark_agent_speaking()
     
     @session.on("speech_created")
     def on_speech_created(event):
@@ -144,7 +252,7 @@ async def entrypoint(ctx: JobContext):
         """Capture conversation items - send AI message IMMEDIATELY"""
         item = event.item
         
-        # Only capture agent messages (user messages are handled by user_input_transcribed)
+        # Only capture agent messages (user messages are handled by OnboardingAgent)
         if item.role == "assistant" and item.text_content:
             text = item.text_content
             
@@ -155,6 +263,7 @@ async def entrypoint(ctx: JobContext):
             
             last_ai_message["text"] = text
             logger.info(f"[AI] {text}")
+            recorder.record_turn("assistant", text)
             
             # Parse for action triggers in the response
             async def process_and_publish():
@@ -180,6 +289,7 @@ async def entrypoint(ctx: JobContext):
                             name = re.sub(r'[,\.]?\s*(does this|is this|correct).*$', '', name, flags=re.IGNORECASE).strip()
                             if name and len(name) < 100:  # Sanity check
                                 logger.info(f"[DATA] Extracted name: {name}")
+                                recorder.record_field("name", name)
                                 await room.local_participant.publish_data(
                                     json.dumps({"action": "fill_field", "field": "name", "value": name}).encode('utf-8'),
                                     reliable=True,
@@ -194,6 +304,7 @@ async def entrypoint(ctx: JobContext):
                             industry = re.sub(r'[,\.]?\s*(does this|is this|correct).*$', '', industry, flags=re.IGNORECASE).strip()
                             if industry and len(industry) < 100:
                                 logger.info(f"[DATA] Extracted industry: {industry}")
+                                recorder.record_field("customCategory", industry)
                                 await room.local_participant.publish_data(
                                     json.dumps({"action": "fill_field", "field": "customCategory", "value": industry}).encode('utf-8'),
                                     reliable=True,
@@ -208,6 +319,7 @@ async def entrypoint(ctx: JobContext):
                             description = re.sub(r'[,\.]?\s*(does this|is this|correct).*$', '', description, flags=re.IGNORECASE).strip()
                             if description and len(description) < 200:
                                 logger.info(f"[DATA] Extracted description: {description}")
+                                recorder.record_field("description", description)
                                 await room.local_participant.publish_data(
                                     json.dumps({"action": "fill_field", "field": "description", "value": description}).encode('utf-8'),
                                     reliable=True,
@@ -222,6 +334,7 @@ async def entrypoint(ctx: JobContext):
                             phone = re.sub(r'[,\.]?\s*(does this|is this|correct).*$', '', phone, flags=re.IGNORECASE).strip()
                             if phone and 'none' not in phone.lower() and 'not provided' not in phone.lower() and len(phone) < 50:
                                 logger.info(f"[DATA] Extracted phone: {phone}")
+                                recorder.record_field("phone", phone)
                                 await room.local_participant.publish_data(
                                     json.dumps({"action": "fill_field", "field": "phone", "value": phone}).encode('utf-8'),
                                     reliable=True,
@@ -236,6 +349,7 @@ async def entrypoint(ctx: JobContext):
                             email = re.sub(r'[,\.]?\s*(does this|is this|correct).*$', '', email, flags=re.IGNORECASE).strip()
                             if email and 'none' not in email.lower() and 'not provided' not in email.lower() and '@' in email and len(email) < 100:
                                 logger.info(f"[DATA] Extracted email: {email}")
+                                recorder.record_field("email", email)
                                 await room.local_participant.publish_data(
                                     json.dumps({"action": "fill_field", "field": "email", "value": email}).encode('utf-8'),
                                     reliable=True,
@@ -250,6 +364,7 @@ async def entrypoint(ctx: JobContext):
                             website = re.sub(r'[,\.]?\s*(does this|is this|correct).*$', '', website, flags=re.IGNORECASE).strip()
                             if website and 'none' not in website.lower() and 'not provided' not in website.lower() and len(website) < 100:
                                 logger.info(f"[DATA] Extracted website: {website}")
+                                recorder.record_field("website", website)
                                 await room.local_participant.publish_data(
                                     json.dumps({"action": "fill_field", "field": "website", "value": website}).encode('utf-8'),
                                     reliable=True,
@@ -298,6 +413,7 @@ async def entrypoint(ctx: JobContext):
                         
                         if services:
                             logger.info(f"[DATA] Extracted services: {services}")
+                            recorder.record_field("services", services)
                             await room.local_participant.publish_data(
                                 json.dumps({"action": "fill_field", "field": "services", "value": services}).encode('utf-8'),
                                 reliable=True,
@@ -350,6 +466,7 @@ async def entrypoint(ctx: JobContext):
                         
                         if working_hours:
                             logger.info(f"[DATA] Extracted working hours: {working_hours}")
+                            recorder.record_field("workingHours", working_hours)
                             await room.local_participant.publish_data(
                                 json.dumps({"action": "fill_field", "field": "workingHours", "value": working_hours}).encode('utf-8'),
                                 reliable=True,
@@ -382,6 +499,7 @@ async def entrypoint(ctx: JobContext):
                         if match:
                             step_num = int(match.group(1))
                             logger.info(f"[ACTION] Step {step_num} complete")
+                            recorder.record_step(step_num)
                             await room.local_participant.publish_data(
                                 json.dumps({"action": "step_complete", "step": step_num}).encode('utf-8'),
                                 reliable=True,
@@ -401,6 +519,7 @@ async def entrypoint(ctx: JobContext):
                         "services does"
                     ]):
                         logger.info("[ACTION] Detected step 1 completion (moving to services)")
+                        recorder.record_step(1)
                         await room.local_participant.publish_data(
                             json.dumps({"action": "step_complete", "step": 1}).encode('utf-8'),
                             reliable=True,
@@ -417,6 +536,7 @@ async def entrypoint(ctx: JobContext):
                         "how late do you stay open"
                     ]):
                         logger.info("[ACTION] Detected step 2 completion (moving to hours)")
+                        recorder.record_step(2)
                         await room.local_participant.publish_data(
                             json.dumps({"action": "step_complete", "step": 2}).encode('utf-8'),
                             reliable=True,
@@ -426,11 +546,13 @@ async def entrypoint(ctx: JobContext):
                     # Step 3 complete: says "all set" or "workspace is being set up"
                     if any(phrase in text.lower() for phrase in ["your business is all set up", "you can now launch", "workspace is being set up"]):
                         logger.info("[ACTION] Detected step 3 completion (all done)")
+                        recorder.record_step(3)
                         await room.local_participant.publish_data(
                             json.dumps({"action": "step_complete", "step": 3}).encode('utf-8'),
                             reliable=True,
                             topic="chat"
                         )
+                        recorder.mark_complete()
                         # Also send complete action
                         await room.local_participant.publish_data(
                             json.dumps({"action": "voice_complete"}).encode('utf-8'),
@@ -461,4 +583,12 @@ async def entrypoint(ctx: JobContext):
     await asyncio.sleep(float('inf'))
 
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+    # Run jobs as threads in one process so every room shares the LLM scheduler
+    # Loading (or first downloading) the Whisper model in prewarm takes far longer than the default 10s
+    local_stt = stt_provider() in ('local', 'fallback')
+    cli.run_app(WorkerOptions(
+        entrypoint_fnc=entrypoint,
+        prewarm_fnc=prewarm,
+        job_executor_type=JobExecutorType.THREAD,
+        initialize_process_timeout=float(os.getenv('LOCAL_STT_INIT_TIMEOUT', '180')) if local_stt else 10.0,
+    ))
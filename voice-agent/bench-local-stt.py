@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""Benchmark the local STT engine: real-time factor and word error rate on recorded onboarding audio.
+
+Expects a directory of 16-bit WAV clips, each with a reference transcript next to it:
+    recordings/business-name-01.wav
+    recordings/business-name-01.txt
+
+    python bench-local-stt.py recordings/ --concurrency 8
+
+--stream also plays every clip through the streaming recognizer in real time, followed by
+background audio, and measures the time from the end of the clip to its final transcript:
+
+    python bench-local-stt.py recordings/ --stream --noise-dbfs -35
+"""
+
+import argparse
+import asyncio
+import glob
+import os
+import re
+import sys
+import time
+import wave
+
+import numpy as np
+from livekit import rtc
+from livekit.agents import stt
+
+from local_stt_plugin import SAMPLE_RATE, LocalSTT, get_engine, to_whisper_audio
+
+STREAM_FRAME_SECONDS = 0.02
+
+
+def load_clip(path):
+    with wave.open(path, 'rb') as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path} must be 16-bit PCM")
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        return to_whisper_audio(samples, f.getframerate(), f.getnchannels())
+
+
+def normalize(text):
+    return re.findall(r"[a-z0-9@.']+", text.lower().replace('-', ' '))
+
+
+def word_errors(reference, hypothesis):
+    """Word-level edit distance between two transcripts"""
+    ref = normalize(reference)
+    hyp = normalize(hypothesis)
+    row = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, hyp_word in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (ref_word != hyp_word))
+    return row[-1], len(ref)
+
+
+async def run_sequential(engine, clips):
+    results = []
+    for name, audio, _ in clips:
+        started = time.monotonic()
+        text, _ = await engine.transcribe(audio)
+        results.append((name, text, time.monotonic() - started))
+    return results
+
+
+async def run_concurrent(engine, clips, concurrency):
+    """Simulate `concurrency` rooms finishing utterances at the same time"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(name, audio):
+        async with semaphore:
+            started = time.monotonic()
+            text, _ = await engine.transcribe(audio)
+            return name, text, time.monotonic() - started
+
+    return await asyncio.gather(*(one(name, audio) for name, audio, _ in clips))
+
+
+async def stream_clip(local_stt, audio, noise_rms, final_timeout, seed):
+    """Play a clip into a stream in real time, then background until its final transcript arrives.
+
+    Returns (final text, seconds from the end of the clip to the last final, or None on timeout).
+    """
+    rng = np.random.default_rng(seed)
+    frame_samples = int(SAMPLE_RATE * STREAM_FRAME_SECONDS)
+    speech = audio * 32767
+    trailing = int(final_timeout * SAMPLE_RATE)
+    pcm = np.concatenate([speech, np.zeros(trailing, dtype=np.float32)])
+    if noise_rms:
+        pcm = pcm + rng.standard_normal(len(pcm)) * noise_rms
+    pcm = np.clip(pcm, -32768, 32767).astype(np.int16)
+
+    stream = local_stt.stream()
+    texts = []
+    clip_end = None
+    final_at = None
+    in_speech = False
+
+    async def read_events():
+        nonlocal final_at, in_speech
+        async for event in stream:
+            if event.type == stt.SpeechEventType.START_OF_SPEECH:
+                in_speech = True
+            elif event.type == stt.SpeechEventType.FINAL_TRANSCRIPT:
+                texts.append(event.alternatives[0].text)
+                final_at = time.monotonic()
+            elif event.type == stt.SpeechEventType.END_OF_SPEECH:
+                in_speech = False
+
+    reader = asyncio.create_task(read_events())
+    endpointed = False
+    started = time.monotonic()
+    for i, offset in enumerate(range(0, len(pcm), frame_samples)):
+        if offset >= len(speech) and clip_end is None:
+            clip_end = time.monotonic()
+        if clip_end is not None and not in_speech:
+            endpointed = True  # The last utterance has ended (finals are sent before END_OF_SPEECH)
+            break
+        chunk = pcm[offset:offset + frame_samples]
+        stream.push_frame(rtc.AudioFrame(chunk.tobytes(), SAMPLE_RATE, 1, len(chunk)))
+        # Pace frames like a live call instead of as fast as the loop allows
+        await asyncio.sleep(max(started + (i + 1) * STREAM_FRAME_SECONDS - time.monotonic(), 0))
+    stream.end_input()
+    await reader
+
+    # A final that only came because the input ran out means endpointing never fired
+    if not endpointed or final_at is None:
+        return ' '.join(texts), None
+    # A clip with trailing silence can be endpointed before it finishes playing
+    return ' '.join(texts), max(final_at - clip_end, 0.0)
+
+
+async def run_streaming(args, engine, clips):
+    """Simulate `concurrency` callers talking to the streaming recognizer at once"""
+    vad = None
+    if args.vad == "silero":
+        from livekit.plugins import silero
+        vad = silero.VAD.load()
+    local_stt = LocalSTT(engine=engine, vad=vad)
+    noise_rms = 32768 * 10 ** (args.noise_dbfs / 20) if args.noise_dbfs is not None else 0.0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(seed, name, audio):
+        async with semaphore:
+            text, to_final = await stream_clip(local_stt, audio, noise_rms, args.final_timeout, seed)
+            return name, text, to_final
+
+    results = await asyncio.gather(*(one(i, name, audio) for i, (name, audio, _) in enumerate(clips)))
+
+    references = {name: reference for name, _, reference in clips}
+    errors = words = 0
+    for name, text, _ in results:
+        e, n = word_errors(references[name], text)
+        errors += e
+        words += n
+    finals = sorted(t for _, _, t in results if t is not None)
+    timeouts = sum(1 for _, _, t in results if t is None)
+    background = f"noise at {args.noise_dbfs} dBFS" if args.noise_dbfs is not None else "digital silence"
+
+    print(f"\nStreaming ({args.vad} endpointing, {background}, {args.concurrency} callers)")
+    if finals:
+        print(f"  Time to final p50: {finals[len(finals) // 2] * 1000:.0f}ms   "
+              f"p95: {finals[min(int(len(finals) * 0.95), len(finals) - 1)] * 1000:.0f}ms   max: {finals[-1] * 1000:.0f}ms")
+    print(f"  No final within {args.final_timeout:.0f}s: {timeouts} of {len(clips)} clips")
+    print(f"  WER:          {errors / words:.1%}  ({errors} errors / {words} words)" if words else "  WER:          n/a")
+
+
+def report(label, clips, results, wall_time):
+    references = {name: reference for name, _, reference in clips}
+    audio_seconds = sum(len(audio) for _, audio, _ in clips) / SAMPLE_RATE
+    errors = words = 0
+    for name, text, _ in results:
+        e, n = word_errors(references[name], text)
+        errors += e
+        words += n
+    latencies = sorted(latency for _, _, latency in results)
+
+    print(f"\n{label}")
+    print(f"  Audio:        {audio_seconds:.1f}s in {len(clips)} clips")
+    print(f"  Wall time:    {wall_time:.2f}s")
+    print(f"  RTF:          {wall_time / audio_seconds:.3f}  (below 1.0 is faster than real time)")
+    print(f"  Latency p50:  {latencies[len(latencies) // 2] * 1000:.0f}ms   p95: {latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000:.0f}ms")
+    print(f"  WER:          {errors / words:.1%}  ({errors} errors / {words} words)" if words else "  WER:          n/a")
+
+
+async def main(args):
+    clips = []
+    for path in sorted(glob.glob(os.path.join(args.directory, "*.wav"))):
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        if not os.path.exists(reference_path):
+            print(f"⚠️ Skipping {path}: no reference transcript")
+            continue
+        with open(reference_path) as f:
+            clips.append((os.path.basename(path), load_clip(path), f.read().strip()))
+    if not clips:
+        print(f"❌ No WAV + .txt pairs found in {args.directory}")
+        sys.exit(1)
+
+    engine = get_engine()
+    started = time.monotonic()
+    engine.load()
+    print(f"✓ Model loaded in {time.monotonic() - started:.1f}s")
+
+    # Warm up so the first clip doesn't pay for lazy initialization
+    await engine.transcribe(clips[0][1])
+
+    started = time.monotonic()
+    results = await run_sequential(engine, clips)
+    report("Sequential (one room)", clips, results, time.monotonic() - started)
+
+    batches_before = engine.stats["batches"]
+    started = time.monotonic()
+    results = await run_concurrent(engine, clips, args.concurrency)
+    report(f"Concurrent ({args.concurrency} rooms, batched)", clips, results, time.monotonic() - started)
+    batches = engine.stats["batches"] - batches_before
+    print(f"  Batches:      {batches} (avg {len(clips) / max(batches, 1):.1f} requests per batch)")
+
+    if args.show_errors:
+        references = {name: reference for name, _, reference in clips}
+        print("\nTranscripts with errors:")
+        for name, text, _ in results:
+            if word_errors(references[name], text)[0]:
+                print(f"  {name}\n    ref: {references[name]}\n    hyp: {text}")
+
+    if args.stream:
+        await run_streaming(args, engine, clips)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the local STT engine")
+    parser.add_argument("directory", help="Directory of WAV clips with matching .txt transcripts")
+    parser.add_argument("--concurrency", type=int, default=8, help="Simulated concurrent rooms")
+    parser.add_argument("--show-errors", action="store_true", help="Print clips whose transcript differs")
+    parser.add_argument("--stream", action="store_true", help="Also measure time to final transcript when streaming")
+    parser.add_argument("--vad", choices=["silero", "energy"], default="silero", help="Streaming endpointer")
+    parser.add_argument("--noise-dbfs", type=float, help="Steady background noise level for streaming, e.g. -35")
+    parser.add_argument("--final-timeout", type=float, default=10.0, help="Seconds of trailing audio per streamed clip")
+    asyncio.run(main(parser.parse_args()))
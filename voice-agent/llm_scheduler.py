@@ -0,0 +1,518 @@
+"""Worker-wide scheduler for Groq LLM requests sharing one rate-limit budget"""
+
+import asyncio
+import enum
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+
+# Completion size assumed when a request doesn't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 256
+
+
+class Priority(enum.IntEnum):
+    INTERACTIVE = 0  # A caller is waiting on this turn
+    BACKGROUND = 1   # Summarization, prefetch and other work nobody is waiting on
+
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+
+
+def parse_duration(value):
+    """Parse Groq reset/retry values like '2m59.56s', '7.66s', '120ms' or '3' into seconds"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _parse_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(body):
+    """Rough token cost of a chat completion request body (prompt chars / 4 + completion budget)"""
+    try:
+        payload = json.loads(body)
+    except (TypeError, ValueError):
+        return 0
+    if not isinstance(payload, dict):
+        return 0
+    prompt_chars = 0
+    for message in payload.get('messages') or []:
+        content = message.get('content') if isinstance(message, dict) else None
+        if isinstance(content, list):
+            # Multi-part content: only text parts count
+            content = ' '.join(str(part.get('text', '')) for part in content if isinstance(part, dict))
+        prompt_chars += len(str(content or ''))
+    completion = payload.get('max_completion_tokens') or payload.get('max_tokens') or DEFAULT_COMPLETION_TOKENS
+    return prompt_chars // 4 + int(completion)
+
+
+class QueueTimeout(Exception):
+    """An interactive request could not be dispatched within max_interactive_wait"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"LLM request queue wait exceeded, budget frees up in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('room', 'priority', 'tokens', 'loop', 'future', 'enqueued_at', 'granted', 'released')
+
+    def __init__(self, room, priority, tokens, loop):
+        self.room = room
+        self.priority = priority
+        self.tokens = tokens
+        self.loop = loop
+        self.future = loop.create_future()
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.released = False
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class LLMScheduler:
+    """Queues LLM requests from every room in the worker against one shared Groq budget.
+
+    Requests per minute are enforced over a sliding 60s window from the configured
+    limit only - Groq's x-ratelimit-*-requests headers describe the daily (RPD) budget,
+    so they are tracked as a separate daily cap. The token budget is per minute and is
+    corrected from the x-ratelimit-*-tokens headers on every response. A 429 blocks
+    all dispatch until its retry-after has passed. Interactive requests are always dispatched before background
+    ones, and within a priority rooms are served round-robin so one chatty room can't
+    starve the others. Interactive requests wait at most max_interactive_wait; past
+    that they fail with QueueTimeout so the caller hears an error instead of silence.
+
+    Thread-safe: with the thread job executor every room runs its own event loop, so
+    waiters are woken with call_soon_threadsafe on the loop that queued them.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_concurrency: int = 4,
+        requests_per_minute: int = 30,
+        tokens_per_minute: int = 6000,
+        background_reserve: float = 0.2,
+        max_interactive_wait: float = 8.0,
+    ):
+        self._lock = threading.Lock()
+        self._max_concurrency = max_concurrency
+        self._requests_per_minute = requests_per_minute
+        self._token_limit = tokens_per_minute
+        # Share of the token budget background work must leave for interactive turns
+        self._background_reserve = background_reserve
+        self._max_interactive_wait = max_interactive_wait
+
+        now = time.monotonic()
+        self._request_times = deque()  # Grant times within the last minute
+        self._remaining_tokens = tokens_per_minute
+        self._tokens_reset_at = now + 60.0
+        # Daily request cap from Groq's headers; None until a response tells us
+        self._remaining_requests_today = None
+        self._requests_today_reset_at = None
+        self._blocked_until = 0.0
+        self._in_flight = 0
+
+        # priority -> room -> FIFO of waiters, plus the round-robin order of rooms
+        self._queues = {priority: {} for priority in Priority}
+        self._room_order = {priority: deque() for priority in Priority}
+
+        self._timer = None
+        self._timer_deadline = 0.0
+
+        self.stats = {
+            "granted": 0,
+            "granted_background": 0,
+            "rate_limited": 0,
+            "queue_timeouts": 0,
+            "max_queue_wait": 0.0,
+        }
+
+    async def acquire(self, room: str, priority: Priority = Priority.INTERACTIVE, tokens: int = 0, deadline=None):
+        """Wait until this room may send a request; returns a grant to pass to release().
+
+        deadline is the monotonic time by which the request must be granted. It defaults
+        to max_wait(priority) from now; retries pass the original request's deadline so
+        the wait limit covers every attempt together.
+        """
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(room, priority, tokens, loop)
+        if deadline is None:
+            deadline = self.deadline(priority)
+        timeout = None if deadline is None else max(deadline - waiter.enqueued_at, 0.0)
+        with self._lock:
+            # Don't queue behind a pause we already know outlasts the caller's patience
+            blocked_for = self._blocked_for_locked(time.monotonic())
+            if timeout is not None and (blocked_for > timeout or timeout <= 0):
+                self.stats["queue_timeouts"] += 1
+                raise QueueTimeout(max(blocked_for, 1.0))
+            queue = self._queues[priority].get(room)
+            if queue is None:
+                queue = self._queues[priority][room] = deque()
+                self._room_order[priority].append(room)
+            queue.append(waiter)
+            self._dispatch_locked()
+
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+            with self._lock:
+                if waiter.granted:
+                    # Granted while we were being cancelled - hand the slot back
+                    waiter.released = True
+                    self._in_flight -= 1
+                else:
+                    self._remove_locked(waiter)
+                self._dispatch_locked()
+                blocked_for = max(self._blocked_for_locked(time.monotonic()), 1.0)
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["queue_timeouts"] += 1
+                logger.warning(f"[SCHEDULER] Room {room} gave up after waiting {timeout:.1f}s for an LLM slot")
+                raise QueueTimeout(blocked_for) from None
+            raise
+        return waiter
+
+    def max_wait(self, priority):
+        """Longest a request of this priority may queue, or None for no limit"""
+        return self._max_interactive_wait if priority is Priority.INTERACTIVE else None
+
+    def deadline(self, priority):
+        """Monotonic time a request of this priority starting now must be granted by, or None"""
+        max_wait = self.max_wait(priority)
+        return None if max_wait is None else time.monotonic() + max_wait
+
+    def blocked_for(self):
+        """Seconds until a 429 pause or an exhausted daily cap ends (0 if neither)"""
+        with self._lock:
+            return self._blocked_for_locked(time.monotonic())
+
+    def release(self, grant):
+        """Free the concurrency slot held by a grant (safe to call more than once)"""
+        with self._lock:
+            if grant.released:
+                return
+            grant.released = True
+            self._in_flight -= 1
+            self._dispatch_locked()
+
+    def update_from_headers(self, headers, status_code=None):
+        """Correct the shared budget from a Groq response's rate-limit headers"""
+        now = time.monotonic()
+        with self._lock:
+            limit_tokens = _parse_int(headers.get('x-ratelimit-limit-tokens'))
+            remaining_requests = _parse_int(headers.get('x-ratelimit-remaining-requests'))
+            remaining_tokens = _parse_int(headers.get('x-ratelimit-remaining-tokens'))
+            reset_requests = parse_duration(headers.get('x-ratelimit-reset-requests'))
+            reset_tokens = parse_duration(headers.get('x-ratelimit-reset-tokens'))
+
+            # Request headers are the daily budget; the per-minute one stays as configured
+            if remaining_requests is not None:
+                self._remaining_requests_today = remaining_requests
+                self._requests_today_reset_at = now + (reset_requests or 60.0)
+            if limit_tokens:
+                self._token_limit = limit_tokens
+            if remaining_tokens is not None:
+                self._remaining_tokens = remaining_tokens
+            if reset_tokens is not None:
+                self._tokens_reset_at = now + reset_tokens
+
+            if status_code == 429:
+                retry_after = parse_duration(headers.get('retry-after'))
+                if retry_after is None:
+                    retry_after = reset_tokens or 1.0
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+                self.stats["rate_limited"] += 1
+                logger.warning(f"[SCHEDULER] Groq rate limit hit, pausing all LLM requests for {retry_after:.2f}s")
+
+            self._dispatch_locked()
+
+    def snapshot(self):
+        """Current budget and queue depth, for logging"""
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "remaining_requests": self._requests_per_minute - len(self._request_times),
+                "remaining_requests_today": self._remaining_requests_today,
+                "remaining_tokens": self._remaining_tokens,
+                "queued": {
+                    priority.name.lower(): sum(len(q) for q in self._queues[priority].values())
+                    for priority in Priority
+                },
+                **self.stats,
+            }
+
+    def _dispatch_locked(self):
+        now = time.monotonic()
+        self._refill_locked(now)
+        while self._in_flight < self._max_concurrency:
+            waiter = self._peek_locked()
+            if waiter is None:
+                return
+            wait = self._budget_wait_locked(waiter, now)
+            if wait > 0:
+                self._schedule_wakeup_locked(wait)
+                return
+            self._pop_locked(waiter)
+            self._grant_locked(waiter, now)
+
+    def _refill_locked(self, now):
+        while self._request_times and now - self._request_times[0] >= 60.0:
+            self._request_times.popleft()
+        # Past the daily reset the cap is unknown until the next response's headers
+        if self._requests_today_reset_at is not None and now >= self._requests_today_reset_at:
+            self._remaining_requests_today = None
+            self._requests_today_reset_at = None
+        # Fall back to a fresh window when headers haven't told us otherwise
+        if now >= self._tokens_reset_at:
+            self._remaining_tokens = self._token_limit
+            self._tokens_reset_at = now + 60.0
+
+    def _budget_wait_locked(self, waiter, now):
+        """Seconds until the budget can cover this waiter, or 0 if it can go now"""
+        blocked_for = self._blocked_for_locked(now)
+        if blocked_for > 0:
+            return blocked_for
+        if len(self._request_times) >= self._requests_per_minute:
+            return max(self._request_times[0] + 60.0 - now, 0.05)
+        needed = waiter.tokens
+        if waiter.priority is Priority.BACKGROUND:
+            needed += int(self._token_limit * self._background_reserve)
+        # A request bigger than the whole window still goes once the window is full
+        if needed > self._remaining_tokens and self._remaining_tokens < self._token_limit:
+            return max(self._tokens_reset_at - now, 0.05)
+        return 0
+
+    def _blocked_for_locked(self, now):
+        blocked_for = self._blocked_until - now
+        if self._remaining_requests_today is not None and self._remaining_requests_today < 1:
+            blocked_for = max(blocked_for, self._requests_today_reset_at - now)
+        return max(blocked_for, 0.0)
+
+    def _peek_locked(self):
+        for priority in Priority:
+            order = self._room_order[priority]
+            if order:
+                return self._queues[priority][order[0]][0]
+        return None
+
+    def _pop_locked(self, waiter):
+        queues = self._queues[waiter.priority]
+        order = self._room_order[waiter.priority]
+        queue = queues[waiter.room]
+        queue.popleft()
+        order.popleft()
+        if queue:
+            # Round-robin: this room goes to the back of the line
+            order.append(waiter.room)
+        else:
+            del queues[waiter.room]
+
+    def _remove_locked(self, waiter):
+        queues = self._queues[waiter.priority]
+        queue = queues.get(waiter.room)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del queues[waiter.room]
+            self._room_order[waiter.priority].remove(waiter.room)
+
+    def _grant_locked(self, waiter, now):
+        waiter.granted = True
+        self._in_flight += 1
+        self._request_times.append(now)
+        if self._remaining_requests_today is not None:
+            self._remaining_requests_today -= 1
+        self._remaining_tokens -= waiter.tokens
+
+        queue_wait = now - waiter.enqueued_at
+        self.stats["granted"] += 1
+        if waiter.priority is Priority.BACKGROUND:
+            self.stats["granted_background"] += 1
+        self.stats["max_queue_wait"] = max(self.stats["max_queue_wait"], queue_wait)
+        if queue_wait > 1.0:
+            logger.info(f"[SCHEDULER] Room {waiter.room} waited {queue_wait:.2f}s for an LLM slot")
+
+        try:
+            waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+        except RuntimeError:
+            # The room's event loop is gone - nobody will use this grant
+            waiter.released = True
+            self._in_flight -= 1
+
+    def _schedule_wakeup_locked(self, delay):
+        deadline = time.monotonic() + delay
+        if self._timer is not None and self._timer_deadline <= deadline:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._on_wakeup)
+        self._timer.daemon = True
+        self._timer_deadline = deadline
+        self._timer.start()
+
+    def _on_wakeup(self):
+        with self._lock:
+            self._timer = None
+            self._timer_deadline = 0.0
+            self._dispatch_locked()
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that hands the scheduler slot back once the stream is finished"""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+def _rate_limited_response(request, retry_after, message):
+    return httpx.Response(
+        status_code=429,
+        headers={"retry-after": f"{retry_after:.2f}"},
+        json={"error": {"message": message, "type": "requests", "code": "rate_limit_exceeded"}},
+        request=request,
+    )
+
+
+class ScheduledTransport(httpx.AsyncBaseTransport):
+    """httpx transport that sends every request through the shared LLMScheduler.
+
+    429 responses are retried here after the scheduler's pause instead of being
+    surfaced to the agent, so one rate-limit burst doesn't fail every active call.
+    """
+
+    def __init__(
+        self,
+        *,
+        room: str,
+        priority: Priority = Priority.INTERACTIVE,
+        scheduler: "LLMScheduler | None" = None,
+        max_retries: int = 3,
+        transport: "httpx.AsyncBaseTransport | None" = None,
+    ):
+        self._room = room
+        self._priority = priority
+        self._scheduler = scheduler or get_scheduler()
+        self._max_retries = max_retries
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        body = await request.aread()
+        tokens = estimate_tokens(body)
+        scheduler = self._scheduler
+
+        # One wait limit for the whole request, however many 429s it is requeued after
+        deadline = scheduler.deadline(self._priority)
+        for attempt in range(self._max_retries + 1):
+            try:
+                grant = await scheduler.acquire(self._room, self._priority, tokens, deadline)
+            except QueueTimeout as e:
+                # Surface as a 429 so the OpenAI client and livekit's error handling take over
+                return _rate_limited_response(request, e.retry_after, str(e))
+            try:
+                response = await self._transport.handle_async_request(request)
+            except BaseException:
+                scheduler.release(grant)
+                raise
+
+            scheduler.update_from_headers(response.headers, response.status_code)
+
+            # Only retry if the pause ends before the caller's deadline
+            retry = attempt < self._max_retries and (
+                deadline is None or scheduler.blocked_for() < deadline - time.monotonic()
+            )
+            if response.status_code == 429 and retry:
+                await response.aclose()
+                scheduler.release(grant)
+                logger.warning(f"[SCHEDULER] Room {self._room} got 429, requeueing (attempt {attempt + 1})")
+                continue
+
+            return httpx.Response(
+                status_code=response.status_code,
+                headers=response.headers,
+                stream=_ReleasingStream(response.stream, lambda grant=grant: scheduler.release(grant)),
+                extensions=response.extensions,
+            )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """The process-wide scheduler, configured from GROQ_* environment variables"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(
+                max_concurrency=int(os.getenv('GROQ_MAX_CONCURRENCY', '4')),
+                requests_per_minute=int(os.getenv('GROQ_REQUESTS_PER_MINUTE', '30')),
+                tokens_per_minute=int(os.getenv('GROQ_TOKENS_PER_MINUTE', '6000')),
+                max_interactive_wait=float(os.getenv('GROQ_MAX_INTERACTIVE_WAIT', '8')),
+            )
+        return _scheduler
+
+
+def create_llm_client(
+    *,
+    api_key: str,
+    room: str,
+    priority: Priority = Priority.INTERACTIVE,
+    base_url: str = GROQ_BASE_URL,
+    scheduler: "LLMScheduler | None" = None,
+):
+    """OpenAI-compatible client whose requests are queued on the shared scheduler"""
+    http_client = httpx.AsyncClient(
+        transport=ScheduledTransport(room=room, priority=priority, scheduler=scheduler),
+        timeout=httpx.Timeout(connect=15.0, read=5.0, write=5.0, pool=5.0),
+        follow_redirects=True,
+    )
+    # Retries on 429 are handled by the transport; other errors by livekit's conn options
+    return openai.AsyncClient(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=0,
+        http_client=http_client,
+    )
@@ -0,0 +1,516 @@
+"""Local STT plugin for LiveKit Agents - quantized Whisper on CPU, batched across rooms"""
+
+import asyncio
+import importlib.util
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+import numpy as np
+from livekit import rtc
+from livekit.agents import DEFAULT_API_CONNECT_OPTIONS, APIConnectOptions, stt, utils
+from livekit.agents.types import NOT_GIVEN, NotGivenOr
+from livekit.agents.utils import AudioBuffer
+from livekit.agents.vad import VAD, VADEventType
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000  # Whisper's native rate
+
+# Streaming recognizer
+INTERIM_INTERVAL_SECONDS = 1.0
+MAX_UTTERANCE_SECONDS = 28.0   # Whisper decodes 30s windows
+
+# Energy endpointing, used when the stream has no VAD
+SPEECH_RMS_THRESHOLD = 300     # int16 RMS, ~ -40 dBFS; the bar on a quiet line
+NOISE_FLOOR_WINDOW_SECONDS = 5.0
+NOISE_FLOOR_MARGIN = 2.0       # Speech must be ~6 dB above the background
+PREROLL_SECONDS = 0.3          # Audio kept from before speech starts
+ENDPOINT_SILENCE_SECONDS = 0.6
+
+# Final transcripts jump ahead of interim ones in the shared queue
+_PRIORITY_FINAL = 0
+_PRIORITY_INTERIM = 1
+
+
+def to_whisper_audio(samples, sample_rate, num_channels=1):
+    """int16 PCM at any rate/channels -> mono float32 at 16kHz"""
+    audio = np.asarray(samples, dtype=np.int16)
+    if num_channels > 1:
+        audio = audio.reshape(-1, num_channels).mean(axis=1)
+    audio = audio.astype(np.float32) / 32768.0
+    if sample_rate != SAMPLE_RATE and len(audio):
+        positions = np.arange(int(len(audio) * SAMPLE_RATE / sample_rate)) * sample_rate / SAMPLE_RATE
+        audio = np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+    return audio
+
+
+def is_available():
+    """Whether faster-whisper is installed (see requirements-local-stt.txt)"""
+    return importlib.util.find_spec('faster_whisper') is not None
+
+
+class _Request:
+    __slots__ = ('audio', 'language', 'loop', 'future')
+
+    def __init__(self, audio, language, loop, future):
+        self.audio = audio
+        self.language = language
+        self.loop = loop
+        self.future = future
+
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future, exc):
+    if not future.done():
+        future.set_exception(exc)
+
+
+class BatchedWhisperEngine:
+    """One faster-whisper model shared by every room in the process.
+
+    Requests from all streams go into one priority queue. Worker threads take
+    whatever is waiting (up to batch_size, lingering batch_wait seconds for more)
+    and decode it in a single CTranslate2 generate() call, so N concurrent rooms
+    cost roughly one encoder pass instead of N.
+    """
+
+    def __init__(
+        self,
+        *,
+        model: str = "base.en",
+        compute_type: str = "int8",
+        cpu_threads: int = 0,
+        workers: int = 1,
+        batch_size: int = 8,
+        batch_wait: float = 0.02,
+        language: str = "en",
+        no_speech_threshold: float = 0.6,
+        log_prob_threshold: float = -1.0,
+    ):
+        self._model_name = model
+        self._compute_type = compute_type
+        self._cpu_threads = cpu_threads
+        self._workers = workers
+        self._batch_size = batch_size
+        self._batch_wait = batch_wait
+        self._language = language
+        self._no_speech_threshold = no_speech_threshold
+        self._log_prob_threshold = log_prob_threshold
+
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._load_lock = threading.Lock()
+        self._model = None
+        self._tokenizers = {}
+
+        self.stats = {"batches": 0, "requests": 0, "no_speech": 0, "audio_seconds": 0.0, "compute_seconds": 0.0}
+
+    def load(self):
+        """Load the model and start the worker threads (blocking; safe to call repeatedly)"""
+        with self._load_lock:
+            if self._model is not None:
+                return
+            try:
+                from faster_whisper import WhisperModel
+            except ImportError:
+                raise RuntimeError("Local STT needs faster-whisper: pip install -r requirements-local-stt.txt")
+
+            started = time.monotonic()
+            self._model = WhisperModel(
+                self._model_name,
+                device="cpu",
+                compute_type=self._compute_type,
+                cpu_threads=self._cpu_threads,
+                num_workers=self._workers,
+            )
+            for i in range(self._workers):
+                threading.Thread(target=self._worker, name=f"local-stt-{i}", daemon=True).start()
+            logger.info(
+                f"[LocalSTT] Loaded {self._model_name} ({self._compute_type}) in {time.monotonic() - started:.1f}s"
+            )
+
+    async def transcribe(self, audio, *, language=None, final=True):
+        """Transcribe mono float32 16kHz audio; returns (text, language)"""
+        if self._model is None:
+            await asyncio.to_thread(self.load)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        priority = _PRIORITY_FINAL if final else _PRIORITY_INTERIM
+        self._queue.put((priority, next(self._seq), _Request(audio, language or self._language, loop, future)))
+        return await future
+
+    def _worker(self):
+        while True:
+            batch = [self._queue.get()[2]]
+            deadline = time.monotonic() + self._batch_wait
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining)[2])
+                except queue.Empty:
+                    break
+            # Requests whose caller has gone away (stream closed, interim superseded) are skipped
+            batch = [r for r in batch if not r.future.done()]
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        import ctranslate2
+        from faster_whisper.audio import pad_or_trim
+
+        started = time.monotonic()
+        try:
+            extractor = self._model.feature_extractor
+            features = np.stack([
+                pad_or_trim(extractor(r.audio), extractor.nb_max_frames).astype(np.float32)
+                for r in batch
+            ])
+            tokenizers = [self._tokenizer(r.language) for r in batch]
+            results = self._model.model.generate(
+                ctranslate2.StorageView.from_array(np.ascontiguousarray(features)),
+                [t.sot_sequence + [t.no_timestamps] for t in tokenizers],
+                beam_size=1,
+                max_length=224,
+                suppress_blank=True,
+                suppress_tokens=[-1],
+                return_scores=True,
+                return_no_speech_prob=True,
+            )
+            # Whisper invents text for noise and breaths ("Thank you.", "you"); drop decodes
+            # the model itself thinks are not speech rather than emit them as transcripts
+            silent = [self._is_silence(r) for r in results]
+            texts = [
+                "" if skip else t.decode(r.sequences_ids[0]).strip()
+                for t, r, skip in zip(tokenizers, results, silent)
+            ]
+        except Exception as e:
+            logger.error(f"[LocalSTT] Batch of {len(batch)} failed: {e}")
+            for r in batch:
+                self._resolve(r, _set_exception, e)
+            return
+
+        elapsed = time.monotonic() - started
+        self.stats["batches"] += 1
+        self.stats["requests"] += len(batch)
+        self.stats["no_speech"] += sum(silent)
+        self.stats["audio_seconds"] += sum(len(r.audio) for r in batch) / SAMPLE_RATE
+        self.stats["compute_seconds"] += elapsed
+        for r, text in zip(batch, texts):
+            self._resolve(r, _set_result, (text, r.language))
+
+    def _is_silence(self, result):
+        """faster-whisper's rule: likely no speech and a low-confidence decode.
+
+        A confident short answer ("yes") can carry a high no-speech probability, so
+        the decode's average log probability has to be low as well.
+        """
+        if result.no_speech_prob <= self._no_speech_threshold:
+            return False
+        # scores are length-normalized; recover the average the way faster-whisper does
+        seq_len = len(result.sequences_ids[0])
+        avg_logprob = result.scores[0] * seq_len / (seq_len + 1)
+        return avg_logprob <= self._log_prob_threshold
+
+    def _tokenizer(self, language):
+        tokenizer = self._tokenizers.get(language)
+        if tokenizer is None:
+            from faster_whisper.tokenizer import Tokenizer
+
+            multilingual = self._model.model.is_multilingual
+            tokenizer = Tokenizer(
+                self._model.hf_tokenizer,
+                multilingual,
+                task="transcribe",
+                language=language if multilingual else None,
+            )
+            self._tokenizers[language] = tokenizer
+        return tokenizer
+
+    @staticmethod
+    def _resolve(request, setter, value):
+        try:
+            request.loop.call_soon_threadsafe(setter, request.future, value)
+        except RuntimeError:
+            pass  # The room's loop already closed
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """The process-wide engine, configured from LOCAL_STT_* environment variables"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = BatchedWhisperEngine(
+                model=os.getenv('LOCAL_STT_MODEL', 'base.en'),
+                compute_type=os.getenv('LOCAL_STT_COMPUTE_TYPE', 'int8'),
+                cpu_threads=int(os.getenv('LOCAL_STT_CPU_THREADS', '0')),
+                workers=int(os.getenv('LOCAL_STT_WORKERS', '1')),
+                batch_size=int(os.getenv('LOCAL_STT_BATCH_SIZE', '8')),
+                batch_wait=float(os.getenv('LOCAL_STT_BATCH_WAIT_MS', '20')) / 1000,
+                language=os.getenv('LOCAL_STT_LANGUAGE', 'en'),
+                no_speech_threshold=float(os.getenv('LOCAL_STT_NO_SPEECH_THRESHOLD', '0.6')),
+                log_prob_threshold=float(os.getenv('LOCAL_STT_LOG_PROB_THRESHOLD', '-1.0')),
+            )
+        return _engine
+
+
+class LocalSTT(stt.STT):
+    """Whisper STT that streams interim and final transcripts.
+
+    Pass the session's VAD to endpoint utterances on its speech events (as
+    stt.StreamAdapter does). Without one, streams fall back to frame energy
+    measured against the line's noise floor.
+    """
+
+    def __init__(
+        self,
+        *,
+        language: str = "en",
+        engine: "BatchedWhisperEngine | None" = None,
+        vad: "VAD | None" = None,
+    ):
+        super().__init__(capabilities=stt.STTCapabilities(streaming=True, interim_results=True))
+        self._language = language
+        self._engine = engine or get_engine()
+        self._vad = vad
+
+    async def _recognize_impl(
+        self,
+        buffer: AudioBuffer,
+        *,
+        language: NotGivenOr[str] = NOT_GIVEN,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> stt.SpeechEvent:
+        audio = frames_to_audio(buffer)
+        text, lang = await self._engine.transcribe(audio, language=language or self._language)
+        return stt.SpeechEvent(
+            type=stt.SpeechEventType.FINAL_TRANSCRIPT,
+            request_id=str(uuid.uuid4()),
+            alternatives=[stt.SpeechData(language=lang, text=text)],
+        )
+
+    def stream(
+        self,
+        *,
+        language: NotGivenOr[str] = NOT_GIVEN,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+    ) -> "SpeechStream":
+        return SpeechStream(
+            stt=self,
+            engine=self._engine,
+            vad=self._vad,
+            language=language or self._language,
+            conn_options=conn_options,
+        )
+
+
+def frames_to_audio(frames):
+    """One or more rtc.AudioFrames -> mono float32 at 16kHz"""
+    frame = rtc.combine_audio_frames(frames)
+    return to_whisper_audio(np.frombuffer(frame.data, dtype=np.int16), frame.sample_rate, frame.num_channels)
+
+
+class NoiseFloor:
+    """Sliding minimum of frame RMS: the line's background level, even while someone talks"""
+
+    def __init__(self, window: float = NOISE_FLOOR_WINDOW_SECONDS):
+        self._window = window
+        self._elapsed = 0.0
+        self._minima = deque()  # (elapsed, rms), rms increasing
+
+    def update(self, rms, duration):
+        self._elapsed += duration
+        while self._minima and self._minima[-1][1] >= rms:
+            self._minima.pop()
+        self._minima.append((self._elapsed, rms))
+        while self._elapsed - self._minima[0][0] > self._window:
+            self._minima.popleft()
+        return self._minima[0][1]
+
+
+class SpeechStream(stt.RecognizeStream):
+    """Interim transcripts while the caller speaks, a final one when the utterance ends"""
+
+    def __init__(
+        self,
+        *,
+        stt: LocalSTT,
+        engine: BatchedWhisperEngine,
+        vad: "VAD | None",
+        language: str,
+        conn_options,
+    ):
+        # The base class resamples pushed frames to SAMPLE_RATE for us
+        super().__init__(stt=stt, conn_options=conn_options, sample_rate=SAMPLE_RATE)
+        self._engine = engine
+        self._vad = vad
+        self._language = language
+
+    async def _run(self) -> None:
+        if self._vad is not None:
+            await self._run_vad()
+        else:
+            await self._run_energy()
+
+    async def _run_vad(self) -> None:
+        """Endpoint on the VAD's speech events, like stt.StreamAdapter"""
+        vad_stream = self._vad.stream()
+
+        async def forward_input():
+            async for data in self._input_ch:
+                if isinstance(data, self._FlushSentinel):
+                    vad_stream.flush()
+                    continue
+                vad_stream.push_frame(data)
+            vad_stream.end_input()
+
+        async def recognize():
+            speech = []
+            since_interim = 0.0
+            interim_task = None
+            request_id = str(uuid.uuid4())
+
+            async for event in vad_stream:
+                if event.type == VADEventType.START_OF_SPEECH:
+                    # Carries the VAD's prefix padding plus the speech that triggered it
+                    speech = [frames_to_audio(event.frames)]
+                    since_interim = 0.0
+                    self._event_ch.send_nowait(
+                        stt.SpeechEvent(type=stt.SpeechEventType.START_OF_SPEECH, request_id=request_id)
+                    )
+                elif event.type == VADEventType.INFERENCE_DONE and event.speaking and speech:
+                    audio = frames_to_audio(event.frames)
+                    speech.append(audio)
+                    since_interim += len(audio) / SAMPLE_RATE
+                    if sum(len(a) for a in speech) / SAMPLE_RATE >= MAX_UTTERANCE_SECONDS:
+                        # Whisper only sees 30s, so a long monologue is finalized in pieces
+                        if interim_task is not None:
+                            interim_task.cancel()
+                        await self._transcribe_final(np.concatenate(speech), request_id)
+                        # Still mid-utterance: keep collecting into an empty (but started) buffer
+                        speech, since_interim = [np.zeros(0, dtype=np.float32)], 0.0
+                    elif since_interim >= INTERIM_INTERVAL_SECONDS and (interim_task is None or interim_task.done()):
+                        since_interim = 0.0
+                        interim_task = asyncio.create_task(self._transcribe_interim(np.concatenate(speech), request_id))
+                elif event.type == VADEventType.END_OF_SPEECH:
+                    if interim_task is not None:
+                        interim_task.cancel()
+                        interim_task = None
+                    if speech:
+                        await self._transcribe_final(np.concatenate(speech), request_id)
+                    speech = []
+                    self._event_ch.send_nowait(
+                        stt.SpeechEvent(type=stt.SpeechEventType.END_OF_SPEECH, request_id=request_id)
+                    )
+                    request_id = str(uuid.uuid4())
+
+            if interim_task is not None:
+                interim_task.cancel()
+
+        tasks = [asyncio.create_task(forward_input()), asyncio.create_task(recognize())]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await utils.aio.cancel_and_wait(*tasks)
+            await vad_stream.aclose()
+
+    async def _run_energy(self) -> None:
+        """Endpoint on frame energy above the noise floor, for streams without a VAD"""
+        preroll = []
+        speech = []
+        speaking = False
+        silence = 0.0
+        since_interim = 0.0
+        interim_task = None
+        noise_floor = NoiseFloor()
+        request_id = str(uuid.uuid4())
+
+        async def finalize():
+            nonlocal speech, speaking, silence, since_interim, interim_task, request_id
+            if interim_task is not None:
+                interim_task.cancel()
+                interim_task = None
+            audio = np.concatenate(speech) if speech else np.zeros(0, dtype=np.float32)
+            speech, speaking, silence, since_interim = [], False, 0.0, 0.0
+            await self._transcribe_final(audio, request_id)
+            self._event_ch.send_nowait(stt.SpeechEvent(type=stt.SpeechEventType.END_OF_SPEECH, request_id=request_id))
+            request_id = str(uuid.uuid4())
+
+        try:
+            async for data in self._input_ch:
+                if isinstance(data, self._FlushSentinel):
+                    if speaking:
+                        await finalize()
+                    continue
+
+                samples = np.frombuffer(data.data, dtype=np.int16)
+                audio = to_whisper_audio(samples, data.sample_rate, data.num_channels)
+                duration = len(audio) / SAMPLE_RATE
+                rms = float(np.sqrt(np.mean(samples.astype(np.float32) ** 2))) if len(samples) else 0.0
+                # Steady background noise raises the bar, so silence still builds up on a noisy line
+                floor = noise_floor.update(rms, duration)
+                loud = rms > max(SPEECH_RMS_THRESHOLD, floor * NOISE_FLOOR_MARGIN)
+
+                if not speaking:
+                    preroll.append(audio)
+                    while len(preroll) > 1 and sum(len(a) for a in preroll) / SAMPLE_RATE > PREROLL_SECONDS:
+                        preroll.pop(0)
+                    if loud:
+                        speaking = True
+                        speech, preroll = preroll, []
+                        self._event_ch.send_nowait(
+                            stt.SpeechEvent(type=stt.SpeechEventType.START_OF_SPEECH, request_id=request_id)
+                        )
+                    continue
+
+                speech.append(audio)
+                silence = 0.0 if loud else silence + duration
+                since_interim += duration
+
+                if silence >= ENDPOINT_SILENCE_SECONDS or sum(len(a) for a in speech) / SAMPLE_RATE >= MAX_UTTERANCE_SECONDS:
+                    await finalize()
+                elif since_interim >= INTERIM_INTERVAL_SECONDS and (interim_task is None or interim_task.done()):
+                    # At most one interim in flight per stream; a slow engine just yields fewer partials
+                    since_interim = 0.0
+                    interim_task = asyncio.create_task(self._transcribe_interim(np.concatenate(speech), request_id))
+
+            if speaking:
+                await finalize()
+        finally:
+            if interim_task is not None:
+                interim_task.cancel()
+
+    async def _transcribe_final(self, audio, request_id):
+        if len(audio):
+            text, lang = await self._engine.transcribe(audio, language=self._language, final=True)
+            if text:
+                self._emit(stt.SpeechEventType.FINAL_TRANSCRIPT, request_id, text, lang)
+
+    async def _transcribe_interim(self, audio, request_id):
+        text, lang = await self._engine.transcribe(audio, language=self._language, final=False)
+        if text:
+            self._emit(stt.SpeechEventType.INTERIM_TRANSCRIPT, request_id, text, lang)
+
+    def _emit(self, event_type, request_id, text, language):
+        self._event_ch.send_nowait(
+            stt.SpeechEvent(
+                type=event_type,
+                request_id=request_id,
+                alternatives=[stt.SpeechData(language=language, text=text)],
+            )
+        )
@@ -0,0 +1,336 @@
+"""Off-hot-path archive of session transcripts and extracted onboarding fields.
+
+Each room gets a SessionRecorder that only appends to in-memory buffers. When the
+session ends the buffered rows are handed to a background writer thread, which
+batches them into compressed, rotated segments (Parquet when pyarrow is installed,
+gzipped JSONL otherwise).
+
+Query the archive with:
+    python session_archive.py stats [--dir archive] [--room ROOM]
+"""
+
+import argparse
+import atexit
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+TABLES = ("sessions", "turns")
+
+
+class SessionRecorder:
+    """Buffers one room's turns, timings and extracted fields until the session closes.
+
+    Every method is a plain append or dict update so it is safe to call from the
+    agent's event handlers without adding latency.
+    """
+
+    def __init__(self, archiver, room):
+        self._archiver = archiver
+        self.room = room
+        self.session_id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self._turns = []
+        self._fields = {}
+        self._steps = []
+        self._completed = False
+        self._user_stopped_at = None   # When the user last stopped speaking
+        self._awaiting_reply_since = None
+        self._reply_latency_ms = None  # Time to first audio of the reply being played
+        self._closed = False
+
+    def mark_user_stopped_speaking(self):
+        self._user_stopped_at = time.time()
+
+    def mark_agent_speaking(self):
+        """The agent's audio started; ends the response latency of an answered user turn"""
+        if self._awaiting_reply_since is not None:
+            self._reply_latency_ms = round((time.time() - self._awaiting_reply_since) * 1000, 1)
+            self._awaiting_reply_since = None
+
+    def record_turn(self, role, text):
+        """Record a user or assistant turn.
+
+        Assistant turns are only added once their audio has finished playing, so their
+        latency_ms is the time from the end of the user's speech to the reply's first
+        audio (see mark_agent_speaking), not to this call.
+        """
+        now = time.time()
+        latency_ms = None
+        if role == "user":
+            self._awaiting_reply_since = self._user_stopped_at or now
+            self._reply_latency_ms = None
+        else:
+            latency_ms = self._reply_latency_ms
+            self._reply_latency_ms = None
+        self._turns.append({
+            "session_id": self.session_id,
+            "room": self.room,
+            "turn": len(self._turns),
+            "role": role,
+            "text": text,
+            "ts": now,
+            "latency_ms": latency_ms,
+        })
+
+    def record_field(self, field, value):
+        """Record the latest extracted value of an onboarding field"""
+        self._fields[field] = value
+
+    def record_step(self, step):
+        if step not in self._steps:
+            self._steps.append(step)
+
+    def mark_complete(self):
+        self._completed = True
+
+    def close(self):
+        """End the session and hand its rows to the background writer"""
+        if self._closed or self._archiver is None:
+            return
+        self._closed = True
+        ended_at = time.time()
+        latencies = [t["latency_ms"] for t in self._turns if t["latency_ms"] is not None]
+        session = {
+            "session_id": self.session_id,
+            "room": self.room,
+            "started_at": self.started_at,
+            "ended_at": ended_at,
+            "duration_s": round(ended_at - self.started_at, 1),
+            "user_turns": sum(1 for t in self._turns if t["role"] == "user"),
+            "assistant_turns": sum(1 for t in self._turns if t["role"] == "assistant"),
+            "avg_latency_ms": round(sum(latencies) / len(latencies), 1) if latencies else None,
+            "steps_completed": json.dumps(self._steps),
+            "completed": self._completed,
+            # Nested values (services, working hours) are stored as JSON text to keep columns flat
+            "fields": json.dumps(self._fields),
+        }
+        self._archiver.submit("sessions", [session])
+        if self._turns:
+            self._archiver.submit("turns", self._turns)
+
+
+class SessionArchiver:
+    """Writes archived rows in bulk from a background thread"""
+
+    def __init__(
+        self,
+        directory: str = "archive",
+        *,
+        fmt: str = "auto",
+        flush_rows: int = 5000,
+        flush_interval: float = 60.0,
+        max_segments: "int | None" = None,
+    ):
+        if fmt == "auto":
+            fmt = "parquet" if pa is not None else "jsonl"
+        if fmt == "parquet" and pa is None:
+            logger.warning("[ARCHIVE] pyarrow not installed, falling back to gzipped JSONL")
+            fmt = "jsonl"
+        self.directory = directory
+        self.format = fmt
+        self._flush_rows = flush_rows
+        self._flush_interval = flush_interval
+        self._max_segments = max_segments
+        self._queue = queue.SimpleQueue()
+        self._pending = {table: [] for table in TABLES}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="session-archiver", daemon=True)
+        self._thread.start()
+
+    def open_session(self, room):
+        return SessionRecorder(self, room)
+
+    def submit(self, table, rows):
+        """Queue rows for writing; never blocks the caller"""
+        self._queue.put((table, rows))
+
+    def close(self, timeout: float = 10.0):
+        """Flush everything still buffered and stop the writer thread"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(self._flush_interval - (time.monotonic() - last_flush), 0.1)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                self._flush_all()
+                return
+            if item:
+                table, rows = item
+                self._pending[table].extend(rows)
+            buffered = sum(len(rows) for rows in self._pending.values())
+            if buffered >= self._flush_rows or time.monotonic() - last_flush >= self._flush_interval:
+                self._flush_all()
+                last_flush = time.monotonic()
+
+    def _flush_all(self):
+        for table in TABLES:
+            rows = self._pending[table]
+            if not rows:
+                continue
+            self._pending[table] = []
+            try:
+                self._write_segment(table, rows)
+            except Exception as e:
+                logger.error(f"[ARCHIVE] Failed to write {len(rows)} {table} rows: {e}")
+
+    def _write_segment(self, table, rows):
+        table_dir = os.path.join(self.directory, table)
+        os.makedirs(table_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+        base = os.path.join(table_dir, f"{table}-{stamp}-{uuid.uuid4().hex[:8]}")
+
+        if self.format == "parquet":
+            path = base + ".parquet"
+            pq.write_table(pa.Table.from_pylist(rows), path + ".tmp", compression="zstd")
+        else:
+            path = base + ".jsonl.gz"
+            with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+        # Rename so readers never see a half-written segment
+        os.replace(path + ".tmp", path)
+        logger.info(f"[ARCHIVE] Wrote {len(rows)} {table} rows to {path}")
+        if self._max_segments:
+            self._rotate(table_dir)
+
+    def _rotate(self, table_dir):
+        """Delete the oldest segments past max_segments (only when retention is configured)"""
+        segments = sorted(_segment_paths(table_dir))
+        for path in segments[:max(len(segments) - self._max_segments, 0)]:
+            os.unlink(path)
+
+
+def _segment_paths(table_dir):
+    return glob.glob(os.path.join(table_dir, "*.parquet")) + glob.glob(os.path.join(table_dir, "*.jsonl.gz"))
+
+
+_archiver = None
+_archiver_lock = threading.Lock()
+
+
+def get_archiver():
+    """The process-wide archiver, or None when SESSION_ARCHIVE_DIR is set to an empty string"""
+    global _archiver
+    with _archiver_lock:
+        if _archiver is None:
+            directory = os.getenv('SESSION_ARCHIVE_DIR', 'archive')
+            if not directory:
+                return None
+            _archiver = SessionArchiver(
+                directory,
+                fmt=os.getenv('SESSION_ARCHIVE_FORMAT', 'auto'),
+                flush_interval=float(os.getenv('SESSION_ARCHIVE_FLUSH_SECONDS', '60')),
+                # Unset or 0 keeps every segment; set it to cap disk use
+                max_segments=int(os.getenv('SESSION_ARCHIVE_MAX_SEGMENTS', '0')) or None,
+            )
+            atexit.register(_archiver.close)
+        return _archiver
+
+
+def open_session(room):
+    """Start recording a room's session (recording is dropped if archiving is disabled)"""
+    return SessionRecorder(get_archiver(), room)
+
+
+def load_rows(directory, table):
+    """Read every segment of a table back as a list of dicts"""
+    rows = []
+    for path in sorted(_segment_paths(os.path.join(directory, table))):
+        if path.endswith(".parquet"):
+            if pq is None:
+                raise RuntimeError(f"pyarrow is required to read {path}")
+            rows.extend(pq.read_table(path).to_pylist())
+        else:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                rows.extend(json.loads(line) for line in f if line.strip())
+    return rows
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+def print_stats(directory, room=None):
+    sessions = load_rows(directory, "sessions")
+    turns = load_rows(directory, "turns")
+    if room:
+        sessions = [s for s in sessions if s["room"] == room]
+        turns = [t for t in turns if t["room"] == room]
+    if not sessions:
+        print("No archived sessions found")
+        return
+
+    completed = sum(1 for s in sessions if s["completed"])
+    durations = [s["duration_s"] for s in sessions]
+    latencies = [t["latency_ms"] for t in turns if t["latency_ms"] is not None]
+
+    print(f"Sessions:           {len(sessions)}")
+    print(f"Completed:          {completed} ({completed / len(sessions):.0%})")
+    print(f"Duration p50/p95:   {_percentile(durations, 50)}s / {_percentile(durations, 95)}s")
+    print(f"Turns:              {len(turns)} ({len(turns) / len(sessions):.1f} per session)")
+    if latencies:
+        # End of the user's speech to the reply's first audio
+        print(f"First audio p50/p95: {_percentile(latencies, 50)}ms / {_percentile(latencies, 95)}ms")
+
+    # How often each onboarding field was extracted
+    field_counts = {}
+    for s in sessions:
+        for field in json.loads(s["fields"] or "{}"):
+            field_counts[field] = field_counts.get(field, 0) + 1
+    if field_counts:
+        print("\nField extraction rate:")
+        for field, count in sorted(field_counts.items(), key=lambda item: -item[1]):
+            print(f"  {field:15s} {count:5d}  ({count / len(sessions):.0%})")
+
+    step_counts = {}
+    for s in sessions:
+        for step in json.loads(s["steps_completed"] or "[]"):
+            step_counts[step] = step_counts.get(step, 0) + 1
+    if step_counts:
+        print("\nStep conversion:")
+        for step in sorted(step_counts):
+            print(f"  step {step}: {step_counts[step]:5d}  ({step_counts[step] / len(sessions):.0%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the voice agent session archive")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    stats = subparsers.add_parser("stats", help="Aggregate stats over archived sessions")
+    stats.add_argument("--dir", default=os.getenv('SESSION_ARCHIVE_DIR') or "archive")
+    stats.add_argument("--room", help="Only include sessions from this room")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print_stats(args.dir, room=args.room)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
+import argparse
 import asyncio
+import json
 import logging
 import os
+import sys
+import time
+import wave
 import numpy as np
 from dotenv import load_dotenv
 from livekit.agents import AutoSubscribe, JobContext, WorkerOptions, cli
-from livekit import rtc
+from livekit import api, rtc
 
 # Load environment variables
 load_dotenv()
@@ -33,6 +38,52 @@ def generate_test_audio(duration_seconds=3, sample_rate=48000):
     
     return audio_data.tobytes()
 
+def generate_chirp(duration_seconds=0.3, sample_rate=48000, start_hz=1000, end_hz=4000):
+    """Generate a linear frequency sweep used to tag the start of a probe turn"""
+    t = np.arange(int(sample_rate * duration_seconds)) / sample_rate
+    sweep_rate = (end_hz - start_hz) / duration_seconds
+    chirp = np.sin(2 * np.pi * (start_hz * t + 0.5 * sweep_rate * t ** 2))
+    # Hann window so the chirp has no clicks and a sharp correlation peak
+    chirp *= np.hanning(len(chirp))
+    return (chirp * 32767 * 0.5).astype(np.int16)
+
+def load_utterance(path, sample_rate=48000):
+    """Load a 16-bit mono WAV, resampled to sample_rate"""
+    with wave.open(path, 'rb') as f:
+        if f.getsampwidth() != 2:
+            raise ValueError(f"{path} must be 16-bit PCM")
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        if f.getnchannels() > 1:
+            samples = samples.reshape(-1, f.getnchannels()).mean(axis=1).astype(np.int16)
+        source_rate = f.getframerate()
+    if source_rate != sample_rate:
+        positions = np.arange(int(len(samples) * sample_rate / source_rate)) * source_rate / sample_rate
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.int16)
+    return samples
+
+async def play_audio(audio_source, audio_data, sample_rate):
+    """Play int16 PCM bytes into an audio source in real-time 100ms chunks"""
+    chunk_size = sample_rate // 10  # 100ms chunks
+    num_samples = len(audio_data) // 2  # int16 = 2 bytes per sample
+    
+    for i in range(0, num_samples, chunk_size):
+        end = min(i + chunk_size, num_samples)
+        chunk = audio_data[i*2:end*2]
+        
+        # Convert bytes to numpy array
+        samples = np.frombuffer(chunk, dtype=np.int16)
+        
+        # Create audio frame
+        frame = rtc.AudioFrame.create(sample_rate, 1, len(samples))
+        frame_data = np.frombuffer(frame.data, dtype=np.int16)
+        np.copyto(frame_data, samples)
+        
+        # Capture frame to source
+        await audio_source.capture_frame(frame)
+        
+        # Wait for real-time playback
+        await asyncio.sleep(len(samples) / sample_rate)
+
 async def entrypoint(ctx: JobContext):
     """Test agent that plays a beep sound"""
     logger.info(f"🧪 TEST AGENT starting for room: {ctx.room.name}")
@@ -66,29 +117,9 @@ async def entrypoint(ctx: JobContext):
     publication = await ctx.room.local_participant.publish_track(track, options)
     logger.info(f"✅ Track published: {publication.sid}")
     
-    # Send audio in chunks
-    chunk_size = sample_rate // 10  # 100ms chunks
-    num_samples = len(audio_data) // 2  # int16 = 2 bytes per sample
-    
     logger.info("🎵 Playing audio...")
     
-    for i in range(0, num_samples, chunk_size):
-        end = min(i + chunk_size, num_samples)
-        chunk = audio_data[i*2:end*2]
-        
-        # Convert bytes to numpy array
-        samples = np.frombuffer(chunk, dtype=np.int16)
-        
-        # Create audio frame
-        frame = rtc.AudioFrame.create(sample_rate, 1, len(samples))
-        frame_data = np.frombuffer(frame.data, dtype=np.int16)
-        np.copyto(frame_data, samples)
-        
-        # Capture frame to source
-        await audio_source.capture_frame(frame)
-        
-        # Wait for real-time playback
-        await asyncio.sleep(len(samples) / sample_rate)
+    await play_audio(audio_source, audio_data, sample_rate)
     
     logger.info("✅ Audio playback complete!")
     logger.info("💡 If you heard a 3-second beep, LiveKit audio is working!")
@@ -99,5 +130,287 @@ async def entrypoint(ctx: JobContext):
     
     logger.info("👋 Test complete, disconnecting...")
 
+
+# ---------------------------------------------------------------------------
+# Latency probe: `python test-agent.py probe --utterance hello.wav`
+#
+# Joins a room as a simulated user ("mouth") plus a listener ("ear"). The mouth
+# joins first and the ear only after the agent's session has started, so the
+# agent links to probe-mouth rather than the silent ear. Each iteration the
+# mouth plays a chirp followed by the utterance. The ear records both the
+# mouth's track and the agent's reply on one clock:
+#   - path latency: cross-correlating the chirp against the ear's copy of the
+#     mouth track gives the one-way media path through the SFU
+#   - turn latency: end of utterance (mouth clock) to the onset of agent audio
+#     (ear clock) is the mouth-to-ear turn latency the caller experiences
+# ---------------------------------------------------------------------------
+
+PROBE_SAMPLE_RATE = 48000
+ONSET_WINDOW_SECONDS = 0.02
+ONSET_RMS_THRESHOLD = 500  # ~ -36 dBFS
+ONSET_MIN_WINDOWS = 3      # 60ms of sustained audio counts as speech
+REPLY_SILENCE_SECONDS = 1.5
+
+
+class TrackRecorder:
+    """Records a remote audio track together with the local arrival time of every frame"""
+    
+    def __init__(self, track, sample_rate=PROBE_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._chunks = []
+        self._task = asyncio.create_task(self._run(track))
+    
+    async def _run(self, track):
+        stream = rtc.AudioStream(track, sample_rate=self.sample_rate, num_channels=1)
+        async for event in stream:
+            samples = np.frombuffer(event.frame.data, dtype=np.int16).copy()
+            self._chunks.append((time.monotonic(), samples))
+    
+    def window(self, start, end):
+        """Samples that arrived between start and end, and the local time of the first one"""
+        chunks = [(t, s) for t, s in self._chunks if start <= t <= end]
+        if not chunks:
+            return None, np.zeros(0, dtype=np.int16)
+        first_arrival, first_samples = chunks[0]
+        # A frame arrives once its last sample is in, so back-date to its first sample
+        first_time = first_arrival - len(first_samples) / self.sample_rate
+        return first_time, np.concatenate([s for _, s in chunks])
+    
+    def last_activity(self, since):
+        """Arrival time of the most recent non-silent frame after since, or None"""
+        for t, samples in reversed(self._chunks):
+            if t < since:
+                return None
+            if len(samples) and np.sqrt(np.mean(samples.astype(np.float64) ** 2)) > ONSET_RMS_THRESHOLD:
+                return t
+        return None
+
+
+def xcorr_lag(signal, template):
+    """Sample offset where template best matches signal (FFT cross-correlation) and its normalized score"""
+    signal = signal.astype(np.float64)
+    template = template.astype(np.float64)
+    if len(signal) < len(template):
+        return None, 0.0
+    n = len(signal) + len(template) - 1
+    size = 1 << (n - 1).bit_length()
+    corr = np.fft.irfft(np.fft.rfft(signal, size) * np.conj(np.fft.rfft(template, size)), size)
+    corr = corr[:len(signal) - len(template) + 1]
+    lag = int(np.argmax(corr))
+    segment_energy = np.linalg.norm(signal[lag:lag + len(template)]) * np.linalg.norm(template)
+    score = corr[lag] / segment_energy if segment_energy else 0.0
+    return lag, float(score)
+
+
+def detect_onset(samples, sample_rate):
+    """Sample index where sustained speech starts, or None"""
+    window = int(sample_rate * ONSET_WINDOW_SECONDS)
+    count = len(samples) // window
+    if count == 0:
+        return None
+    frames = samples[:count * window].astype(np.float64).reshape(count, window)
+    loud = np.sqrt(np.mean(frames ** 2, axis=1)) > ONSET_RMS_THRESHOLD
+    run = 0
+    for i, is_loud in enumerate(loud):
+        run = run + 1 if is_loud else 0
+        if run >= ONSET_MIN_WINDOWS:
+            return (i - ONSET_MIN_WINDOWS + 1) * window
+    return None
+
+
+def summarize(values):
+    values = np.array(values, dtype=np.float64)
+    if len(values) == 0:
+        return None
+    return {
+        "n": int(len(values)),
+        "p50": round(float(np.percentile(values, 50)), 1),
+        "p90": round(float(np.percentile(values, 90)), 1),
+        "p95": round(float(np.percentile(values, 95)), 1),
+        "p99": round(float(np.percentile(values, 99)), 1),
+        "mean": round(float(values.mean()), 1),
+        "jitter": round(float(values.std()), 1),  # std dev across iterations
+    }
+
+
+def create_token(identity, room_name):
+    return (
+        api.AccessToken(
+            os.getenv('LIVEKIT_API_KEY', 'devkey'),
+            os.getenv('LIVEKIT_API_SECRET', 'secret'),
+        )
+        .with_identity(identity)
+        .with_grants(api.VideoGrants(room_join=True, room=room_name))
+        .to_jwt()
+    )
+
+
+def agent_audio_published(room):
+    """Whether an agent participant in the room has published an audio track"""
+    for participant in room.remote_participants.values():
+        if participant.kind != rtc.ParticipantKind.PARTICIPANT_KIND_AGENT:
+            continue
+        if any(pub.kind == rtc.TrackKind.KIND_AUDIO for pub in participant.track_publications.values()):
+            return True
+    return False
+
+
+async def run_probe(args):
+    """Measure mouth-to-ear turn latency against a running agent"""
+    mouth = rtc.Room()
+    ear = rtc.Room()
+    try:
+        return await probe_rooms(args, mouth, ear)
+    finally:
+        # Every exit path leaves the room, so a failed run doesn't strand participants
+        # (disconnect is a no-op for a room that never connected)
+        await mouth.disconnect()
+        await ear.disconnect()
+
+
+async def probe_rooms(args, mouth, ear):
+    """Connect the mouth and ear, then run the probe iterations"""
+    url = os.getenv('LIVEKIT_URL', 'ws://localhost:7880')
+    sample_rate = PROBE_SAMPLE_RATE
+    chirp = generate_chirp(sample_rate=sample_rate)
+    utterance = load_utterance(args.utterance, sample_rate) if args.utterance else np.zeros(0, dtype=np.int16)
+    gap = np.zeros(int(0.1 * sample_rate), dtype=np.int16)
+    
+    recorders = {}
+    
+    @ear.on("track_subscribed")
+    def on_track_subscribed(track, publication, participant):
+        if track.kind != rtc.TrackKind.KIND_AUDIO:
+            return
+        if participant.identity == "probe-mouth":
+            recorders["mouth"] = TrackRecorder(track, sample_rate)
+        elif participant.kind == rtc.ParticipantKind.PARTICIPANT_KIND_AGENT:
+            recorders["agent"] = TrackRecorder(track, sample_rate)
+            logger.info(f"👂 Recording agent track from {participant.identity}")
+    
+    # The agent links its room input to the first caller it sees, so the mouth must be
+    # alone in the room until the agent's session has started
+    logger.info(f"🔌 Connecting probe to {url}, room {args.room}")
+    await mouth.connect(url, create_token("probe-mouth", args.room), rtc.RoomOptions(auto_subscribe=False))
+    
+    audio_source = rtc.AudioSource(sample_rate, 1)
+    track = rtc.LocalAudioTrack.create_audio_track("probe-audio", audio_source)
+    options = rtc.TrackPublishOptions()
+    options.source = rtc.TrackSource.SOURCE_MICROPHONE
+    await mouth.local_participant.publish_track(track, options)
+    
+    deadline = time.monotonic() + args.join_timeout
+    if args.utterance:
+        # The agent publishes its audio track once session.start() has linked to the mouth
+        while time.monotonic() < deadline and not agent_audio_published(mouth):
+            await asyncio.sleep(0.1)
+        if not agent_audio_published(mouth):
+            logger.error("❌ No agent joined the room - is `python agent.py dev` running against this server?")
+            return None
+        logger.info("🤖 Agent session started, connecting listener")
+    
+    await ear.connect(url, create_token("probe-ear", args.room))
+    
+    # Give the listener time to subscribe to both tracks
+    while time.monotonic() < deadline and ("mouth" not in recorders or (args.utterance and "agent" not in recorders)):
+        await asyncio.sleep(0.1)
+    if "mouth" not in recorders:
+        logger.error("❌ Probe listener never received its own audio track")
+        return None
+    if args.utterance and "agent" not in recorders:
+        logger.warning("⚠️ No agent audio track yet - turn latency will only be measured once it appears")
+    
+    path_ms = []
+    turn_ms = []
+    timeouts = 0
+    
+    for iteration in range(args.iterations):
+        # Send the chirp tag, then the utterance, noting when each leaves the mouth
+        chirp_sent = time.monotonic()
+        await play_audio(audio_source, chirp.tobytes(), sample_rate)
+        await play_audio(audio_source, gap.tobytes(), sample_rate)
+        await play_audio(audio_source, utterance.tobytes(), sample_rate)
+        utterance_end = time.monotonic()
+        
+        result = {"iteration": iteration + 1}
+        
+        # Path latency: find the chirp in what the ear heard of the mouth's track
+        await asyncio.sleep(0.5)
+        first_time, heard = recorders["mouth"].window(chirp_sent - 0.5, time.monotonic())
+        lag, score = xcorr_lag(heard, chirp) if first_time is not None else (None, 0.0)
+        if lag is not None and score > 0.5:
+            path = (first_time + lag / sample_rate - chirp_sent) * 1000
+            path_ms.append(path)
+            result["path_ms"] = round(path, 1)
+        
+        # Turn latency: wait for the agent to start and finish its reply
+        if args.utterance:
+            reply_deadline = utterance_end + args.reply_timeout
+            onset_time = None
+            while time.monotonic() < reply_deadline:
+                await asyncio.sleep(0.1)
+                agent = recorders.get("agent")
+                if agent is None:
+                    continue
+                if onset_time is None:
+                    first_time, reply = agent.window(utterance_end, time.monotonic())
+                    onset = detect_onset(reply, sample_rate) if first_time is not None else None
+                    if onset is not None:
+                        onset_time = first_time + onset / sample_rate
+                else:
+                    last_active = agent.last_activity(onset_time) or onset_time
+                    if time.monotonic() - last_active > REPLY_SILENCE_SECONDS:
+                        break
+            
+            if onset_time is None:
+                timeouts += 1
+                result["turn_ms"] = None
+            else:
+                turn = (onset_time - utterance_end) * 1000
+                turn_ms.append(turn)
+                result["turn_ms"] = round(turn, 1)
+        
+        logger.info(f"📏 {json.dumps(result)}")
+        await asyncio.sleep(args.pause)
+    
+    return {
+        "room": args.room,
+        "iterations": args.iterations,
+        "path_ms": summarize(path_ms),
+        "turn_ms": summarize(turn_ms),
+        "timeouts": timeouts,
+    }
+
+
+def probe_main(argv):
+    parser = argparse.ArgumentParser(prog="test-agent.py probe", description="Measure agent turn latency")
+    parser.add_argument("--room", default="latency-probe")
+    parser.add_argument("--utterance", help="16-bit WAV spoken to the agent each turn (omit to measure path latency only)")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--pause", type=float, default=1.0, help="Seconds between iterations")
+    parser.add_argument("--reply-timeout", type=float, default=15.0)
+    parser.add_argument("--join-timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="Write the summary as JSON to this file")
+    parser.add_argument("--max-p95-ms", type=float, help="Exit non-zero if p95 turn latency exceeds this")
+    args = parser.parse_args(argv)
+    
+    summary = asyncio.run(run_probe(args))
+    if summary is None:
+        sys.exit(1)
+    
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    
+    turn = summary["turn_ms"]
+    if args.max_p95_ms is not None and (turn is None or turn["p95"] > args.max_p95_ms):
+        logger.error(f"❌ p95 turn latency {turn and turn['p95']}ms exceeds budget of {args.max_p95_ms}ms")
+        sys.exit(1)
+
+
 if __name__ == "__main__":
-    cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
+    if len(sys.argv) > 1 and sys.argv[1] == "probe":
+        probe_main(sys.argv[2:])
+    else:
+        cli.run_app(WorkerOptions(entrypoint_fnc=entrypoint))
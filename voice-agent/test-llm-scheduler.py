@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""Exercise the LLM scheduler against a local mock Groq server that enforces rate limits"""
+
+import asyncio
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_scheduler import LLMScheduler, Priority, QueueTimeout, create_llm_client
+
+# Mock server limits - deliberately tiny so the burst below has to queue
+MOCK_REQUESTS_PER_WINDOW = 6
+MOCK_TOKENS_PER_WINDOW = 2000
+MOCK_WINDOW_SECONDS = 2.0
+MOCK_LATENCY_SECONDS = 0.2
+
+# Like Groq, the x-ratelimit-*-requests headers report the daily budget (RPD), not the
+# per-window one; the per-window request limit only shows up as 429s
+MOCK_REQUESTS_PER_DAY = 14400
+
+
+class MockGroqState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.requests = 0
+        self.tokens = 0
+        self.served = 0
+        self.served_today = 0
+        self.rejected = 0
+        # When set, every request gets a 429 with this retry-after (a long TPM/RPD reset)
+        self.force_retry_after = None
+
+
+state = MockGroqState()
+
+
+class MockGroqHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        payload = json.loads(body or b'{}')
+        cost = sum(len(m.get('content', '')) for m in payload.get('messages', [])) // 4 + payload.get('max_tokens', 64)
+
+        if state.force_retry_after is not None:
+            with state.lock:
+                state.rejected += 1
+            headers = {
+                'retry-after': str(state.force_retry_after),
+                'x-ratelimit-limit-requests': str(MOCK_REQUESTS_PER_DAY),
+                'x-ratelimit-remaining-requests': str(MOCK_REQUESTS_PER_DAY - state.served_today),
+            }
+            self._send(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}, headers)
+            return
+
+        with state.lock:
+            now = time.monotonic()
+            if now - state.window_start >= MOCK_WINDOW_SECONDS:
+                state.window_start = now
+                state.requests = 0
+                state.tokens = 0
+            reset = MOCK_WINDOW_SECONDS - (now - state.window_start)
+            limited = state.requests + 1 > MOCK_REQUESTS_PER_WINDOW or state.tokens + cost > MOCK_TOKENS_PER_WINDOW
+            if limited:
+                state.rejected += 1
+            else:
+                state.requests += 1
+                state.tokens += cost
+                state.served += 1
+                state.served_today += 1
+            # Each daily request replenishes after 86400 / RPD seconds, e.g. '2m59.56s'
+            day_reset = state.served_today * 86400 / MOCK_REQUESTS_PER_DAY
+            headers = {
+                'x-ratelimit-limit-requests': str(MOCK_REQUESTS_PER_DAY),
+                'x-ratelimit-limit-tokens': str(MOCK_TOKENS_PER_WINDOW),
+                'x-ratelimit-remaining-requests': str(MOCK_REQUESTS_PER_DAY - state.served_today),
+                'x-ratelimit-remaining-tokens': str(max(MOCK_TOKENS_PER_WINDOW - state.tokens, 0)),
+                'x-ratelimit-reset-requests': f"{int(day_reset // 60)}m{day_reset % 60:.2f}s",
+                'x-ratelimit-reset-tokens': f"{reset:.2f}s",
+            }
+
+        if limited:
+            headers['retry-after'] = f"{reset:.2f}"
+            self._send(429, {"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}}, headers)
+            return
+
+        time.sleep(MOCK_LATENCY_SECONDS)
+        self._send(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get('model', 'mock'),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": cost, "completion_tokens": 1, "total_tokens": cost + 1},
+        }, headers)
+
+    def _send(self, status, payload, headers):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+async def run_room(base_url, scheduler, room, priority, count, results):
+    client = create_llm_client(api_key="mock", room=room, priority=priority, base_url=base_url, scheduler=scheduler)
+    for i in range(count):
+        started = time.monotonic()
+        try:
+            await client.chat.completions.create(
+                model="llama-3.1-8b-instant",
+                messages=[{"role": "user", "content": f"Turn {i} from {room}"}],
+                max_tokens=64,
+            )
+            results.append((priority, room, time.monotonic() - started, None))
+        except Exception as e:
+            results.append((priority, room, time.monotonic() - started, e))
+    await client.close()
+
+
+async def check_long_pause(base_url):
+    """An interactive caller behind a minutes-long pause must fail fast, not hang"""
+    state.force_retry_after = 300
+    scheduler = LLMScheduler(max_interactive_wait=1.0)
+    client = create_llm_client(api_key="mock", room="room-long", base_url=base_url, scheduler=scheduler)
+    failures = []
+    for attempt in range(2):
+        started = time.monotonic()
+        try:
+            await client.chat.completions.create(
+                model="llama-3.1-8b-instant",
+                messages=[{"role": "user", "content": "Hello"}],
+                max_tokens=16,
+            )
+            failures.append(f"attempt {attempt + 1} succeeded despite a 300s rate-limit pause")
+        except Exception as e:
+            elapsed = time.monotonic() - started
+            status = getattr(e, 'status_code', None)
+            print(f"  attempt {attempt + 1}: {type(e).__name__} (status {status}) after {elapsed:.2f}s")
+            if status != 429 or elapsed > 2.0:
+                failures.append(f"attempt {attempt + 1} took {elapsed:.2f}s / status {status}, expected a fast 429")
+    await client.close()
+    state.force_retry_after = None
+    return failures
+
+
+async def check_retry_deadline(base_url):
+    """Repeated short 429s must not stretch the wait limit - it covers the whole request"""
+    state.force_retry_after = 0.9
+    scheduler = LLMScheduler(max_interactive_wait=1.0)
+    client = create_llm_client(api_key="mock", room="room-retry", base_url=base_url, scheduler=scheduler)
+    failures = []
+    started = time.monotonic()
+    try:
+        await client.chat.completions.create(
+            model="llama-3.1-8b-instant",
+            messages=[{"role": "user", "content": "Hello"}],
+            max_tokens=16,
+        )
+        failures.append("request succeeded against a server that always returns 429")
+    except Exception as e:
+        elapsed = time.monotonic() - started
+        status = getattr(e, 'status_code', None)
+        print(f"  {type(e).__name__} (status {status}) after {elapsed:.2f}s with a 1.0s wait limit")
+        if status != 429 or elapsed > 1.5:
+            failures.append(f"retries took {elapsed:.2f}s / status {status}, expected a 429 within the 1.0s limit")
+    await client.close()
+    state.force_retry_after = None
+    return failures
+
+
+async def check_header_meanings():
+    """Groq's request headers are a daily cap; they must not replace the per-minute limit"""
+    failures = []
+    groq_headers = {
+        'x-ratelimit-limit-requests': '14400',
+        'x-ratelimit-remaining-requests': '14370',
+        'x-ratelimit-reset-requests': '2m59.56s',
+        'x-ratelimit-limit-tokens': '100000',
+        'x-ratelimit-remaining-tokens': '100000',
+        'x-ratelimit-reset-tokens': '7.66s',
+    }
+    scheduler = LLMScheduler(max_concurrency=100, requests_per_minute=30, tokens_per_minute=100000, max_interactive_wait=0.3)
+    scheduler.update_from_headers(groq_headers, 200)
+    granted = 0
+    try:
+        for _ in range(31):
+            scheduler.release(await scheduler.acquire("room-rpm"))
+            granted += 1
+    except QueueTimeout:
+        pass
+    snapshot = scheduler.snapshot()
+    print(f"  30 RPM after RPD headers: {granted} granted in the minute, {snapshot['remaining_requests_today']} left today")
+    if granted != 30:
+        failures.append(f"granted {granted} requests in a minute with requests_per_minute=30")
+    if snapshot['remaining_requests_today'] != 14370 - granted:
+        failures.append(f"daily budget {snapshot['remaining_requests_today']}, expected {14370 - granted}")
+
+    # An exhausted daily cap that resets in minutes fails interactive requests straight away
+    scheduler = LLMScheduler(max_interactive_wait=1.0)
+    scheduler.update_from_headers({**groq_headers, 'x-ratelimit-remaining-requests': '0'}, 200)
+    started = time.monotonic()
+    try:
+        scheduler.release(await scheduler.acquire("room-rpd"))
+        failures.append("request granted with the daily cap exhausted")
+    except QueueTimeout as e:
+        elapsed = time.monotonic() - started
+        print(f"  Daily cap exhausted: QueueTimeout after {elapsed:.2f}s (frees up in {e.retry_after:.0f}s)")
+        if elapsed > 0.1:
+            failures.append(f"exhausted daily cap took {elapsed:.2f}s to fail, expected immediately")
+    return failures
+
+
+async def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockGroqHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/openai/v1"
+    print(f"🧪 Mock Groq server on {base_url}")
+
+    # Start with a generous guess so the first burst actually hits the mock's 429s
+    scheduler = LLMScheduler(max_concurrency=4, requests_per_minute=100, tokens_per_minute=100000)
+    results = []
+    rooms = [run_room(base_url, scheduler, f"room-{n}", Priority.INTERACTIVE, 4, results) for n in range(4)]
+    rooms.append(run_room(base_url, scheduler, "summarizer", Priority.BACKGROUND, 4, results))
+
+    started = time.monotonic()
+    await asyncio.gather(*rooms)
+    elapsed = time.monotonic() - started
+    server.shutdown()
+
+    failures = [r for r in results if r[3] is not None]
+    for priority in Priority:
+        waits = sorted(r[2] for r in results if r[0] is priority and r[3] is None)
+        if waits:
+            print(f"  {priority.name.lower():12s} n={len(waits):2d}  p50={waits[len(waits) // 2]:.2f}s  max={waits[-1]:.2f}s")
+
+    print(f"\nServed {state.served}, mock 429s {state.rejected}, caller-visible failures {len(failures)} in {elapsed:.2f}s")
+    print(f"Scheduler: {scheduler.snapshot()}")
+    for _, room, _, error in failures:
+        print(f"❌ {room}: {error}")
+
+    print("\n🧪 Interactive request behind a 300s retry-after")
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockGroqHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    long_pause_failures = await check_long_pause(f"http://127.0.0.1:{server.server_address[1]}/openai/v1")
+
+    print("\n🧪 Interactive request behind repeated 0.9s retry-afters")
+    long_pause_failures += await check_retry_deadline(f"http://127.0.0.1:{server.server_address[1]}/openai/v1")
+    server.shutdown()
+    for failure in long_pause_failures:
+        print(f"❌ {failure}")
+
+    print("\n🧪 Groq rate-limit header meanings")
+    header_failures = await check_header_meanings()
+    for failure in header_failures:
+        print(f"❌ {failure}")
+
+    if failures or long_pause_failures or header_failures:
+        sys.exit(1)
+    print("✅ Queued requests completed without surfacing 429s, long pauses fail fast, and RPM holds")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
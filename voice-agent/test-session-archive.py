@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Record a scripted session, write it as Parquet and as gzipped JSONL, and read both back"""
+
+import json
+import math
+import sys
+import tempfile
+import time
+
+import session_archive
+from session_archive import SessionArchiver, load_rows, print_stats
+
+# Simulated delays, in seconds
+END_OF_TURN_DELAY = 0.05  # End of user speech -> turn accepted
+FIRST_AUDIO_DELAY = 0.15  # Turn accepted -> agent audio starts
+PLAYOUT_DELAY = 0.3       # Agent audio starts -> assistant message added (playout finished)
+
+
+def record_session(archiver):
+    """Drive a recorder in the order the agent's session events fire"""
+    recorder = archiver.open_session("room-check")
+    for user_text, reply in [
+        ("My business is called Acme Salon", "Great! What industry are you in?"),
+        ("Beauty", "Can you briefly describe what your business does?"),
+    ]:
+        recorder.mark_user_stopped_speaking()
+        time.sleep(END_OF_TURN_DELAY)
+        recorder.record_turn("user", user_text)
+        time.sleep(FIRST_AUDIO_DELAY)
+        recorder.mark_agent_speaking()
+        time.sleep(PLAYOUT_DELAY)
+        recorder.record_turn("assistant", reply)
+    recorder.record_field("name", "Acme Salon")
+    recorder.record_field("services", [{"name": "Haircut", "price": 30}])
+    recorder.record_step(1)
+    recorder.mark_complete()
+    recorder.close()
+    return recorder
+
+
+def same(a, b):
+    if isinstance(a, float) and isinstance(b, float):
+        return math.isclose(a, b)
+    return a == b
+
+
+def check_format(fmt):
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        archiver = SessionArchiver(directory, fmt=fmt, flush_interval=0.1)
+        if archiver.format != fmt:
+            return [f"asked for {fmt}, archiver fell back to {archiver.format}"]
+        recorder = record_session(archiver)
+        archiver.close()
+
+        sessions = load_rows(directory, "sessions")
+        turns = load_rows(directory, "turns")
+        if len(sessions) != 1 or len(turns) != 4:
+            return [f"read back {len(sessions)} sessions / {len(turns)} turns, expected 1 / 4"]
+
+        written = recorder._turns
+        for original, loaded in zip(written, turns):
+            for key, value in original.items():
+                if not same(value, loaded.get(key)):
+                    failures.append(f"turn {original['turn']} {key}: wrote {value!r}, read {loaded.get(key)!r}")
+
+        session = sessions[0]
+        if json.loads(session["fields"])["services"][0]["price"] != 30 or session["completed"] is not True:
+            failures.append(f"session row did not round-trip: {session}")
+
+        # Latency runs to the reply's first audio, not to the end of its playout
+        expected_ms = (END_OF_TURN_DELAY + FIRST_AUDIO_DELAY) * 1000
+        for turn in turns:
+            if turn["role"] == "user":
+                if turn["latency_ms"] is not None:
+                    failures.append(f"user turn {turn['turn']} has latency {turn['latency_ms']}")
+            elif not expected_ms - 20 <= turn["latency_ms"] <= expected_ms + 100:
+                failures.append(f"turn {turn['turn']} latency {turn['latency_ms']}ms, expected ~{expected_ms:.0f}ms")
+
+        print(f"  {fmt}: {len(sessions)} session, {len(turns)} turns, "
+              f"latencies {[t['latency_ms'] for t in turns if t['role'] == 'assistant']}ms")
+        print_stats(directory)
+    return failures
+
+
+def main():
+    failures = []
+    formats = ["jsonl", "parquet"]
+    if session_archive.pa is None:
+        print("❌ pyarrow not installed (pip install -r requirements.txt), the Parquet path can't be checked")
+        failures.append("pyarrow missing")
+        formats = ["jsonl"]
+
+    for fmt in formats:
+        print(f"\n🧪 {fmt}")
+        for failure in check_format(fmt):
+            print(f"❌ {failure}")
+            failures.append(failure)
+
+    if failures:
+        sys.exit(1)
+    print("\n✅ Sessions round-trip through Parquet and JSONL with time-to-first-audio latencies")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Run the turn gate over realistic onboarding exchanges and check what it would suppress"""
+
+import sys
+import time
+
+from turn_gate import TurnGate
+
+ECHO_GRACE = 0.2  # Short so "long after" cases don't need a real 2.5s wait
+
+CONFIRM_HOURS = (
+    "Let me confirm your business hours:\n"
+    "- Monday to Friday: 9am to 5pm\n"
+    "Does this look correct, or would you like to change anything?"
+)
+CONFIRM_PROFILE = (
+    "Great! Let me confirm what I have:\n"
+    "- Business name: Acme Salon\n"
+    "- Industry: Beauty\n"
+    "Does this look correct, or would you like to change anything?"
+)
+ASK_PHONE = "What's your business phone number? If you don't have one or want to skip, that's fine."
+ASK_WEBSITE_OPTIONAL = "Do you have a website? Optional."
+ASK_WEBSITE = "Do you have a website?"
+ASK_DESCRIPTION = "Can you briefly describe what your business does?"
+ASK_NAME = "What's your business name?"
+SAVED = "Great, I've saved your services."
+
+# (agent said, agent state when the user's turn completes, user turn, expected reason or None)
+#   speaking     - the agent is still talking
+#   just_stopped - the agent finished a moment ago
+#   long_after   - the agent finished well outside the echo grace period
+CASES = [
+    # Confirm-and-correct flow: corrections repeat most of the agent's wording
+    (CONFIRM_HOURS, "just_stopped", "Monday to Friday 9am to 6pm", None),
+    (CONFIRM_HOURS, "just_stopped", "Actually it's Monday to Friday 9am to 5pm and Saturday 10 to 2", None),
+    (CONFIRM_HOURS, "just_stopped", "Yes, that's correct.", None),
+    (CONFIRM_HOURS, "long_after", "Yeah", None),
+    (CONFIRM_PROFILE, "just_stopped", "Business name is Acme Hair Salon", None),
+    (CONFIRM_PROFILE, "just_stopped", "No, change the industry to hair care", None),
+
+    # Answers that reuse the question's words
+    (ASK_PHONE, "just_stopped", "want to skip", None),
+    (ASK_PHONE, "just_stopped", "I want to skip that", None),
+    (ASK_WEBSITE, "just_stopped", "I do have a website", None),
+    (ASK_DESCRIPTION, "long_after", "We're a salon, we do haircuts and coloring", None),
+    (ASK_NAME, "long_after", "Acme Salon", None),
+    (ASK_NAME, "long_after", "business name", None),
+
+    # Questions with trailing words still make a plain "yes" an answer
+    (ASK_WEBSITE_OPTIONAL, "long_after", "yes", None),
+    (ASK_WEBSITE_OPTIONAL, "long_after", "Yep.", None),
+
+    # Backchannels over the agent's statement are dropped
+    (SAVED, "speaking", "okay", "backchannel"),
+    (SAVED, "speaking", "Okay. Sure.", "backchannel"),
+    (SAVED, "just_stopped", "Yeah, got it.", "backchannel"),
+    (SAVED, "speaking", "Okay, what's next?", None),
+    (ASK_WEBSITE, "just_stopped", "yes", None),
+
+    # Once the agent has yielded the turn, an acknowledgement is what moves onboarding on
+    (SAVED, "long_after", "okay", None),
+    (SAVED, "long_after", "Okay. Sure.", None),
+    (SAVED, "long_after", "Yeah, got it.", None),
+
+    # Fillers and noise
+    (ASK_NAME, "long_after", "Um.", "filler"),
+    (ASK_NAME, "long_after", "Uh, hmm.", "filler"),
+    (ASK_NAME, "long_after", "Um. It's called Acme Salon.", None),
+    (ASK_NAME, "long_after", "a", "too_short"),
+
+    # Echo of the agent's own TTS picked up by the caller's mic
+    (ASK_DESCRIPTION, "speaking", "briefly describe what your business does", "echo"),
+    (ASK_DESCRIPTION, "just_stopped", "can you briefly describe what your business does", "echo"),
+    (ASK_DESCRIPTION, "long_after", "briefly describe what your business does", None),
+    (ASK_WEBSITE, "speaking", "have a website", None),  # Barge-in too short to call echo
+    (ASK_WEBSITE, "speaking", "I have a website", None),
+]
+
+
+def run_case(agent_text, state, user_text):
+    gate = TurnGate(echo_grace=ECHO_GRACE)
+    # Same order as a live session: the reply streams into tts_node in token-sized chunks,
+    # playout starts (agent_state_changed -> speaking) after the first one and the rest
+    # keep arriving while the agent talks
+    chunks = [agent_text[i:i + 5] for i in range(0, len(agent_text), 5)]
+    gate.start_agent_speech()
+    gate.add_agent_speech(chunks[0])
+    gate.set_agent_speaking(True)
+    for chunk in chunks[1:]:
+        gate.add_agent_speech(chunk)
+    if state != "speaking":
+        gate.set_agent_speaking(False)
+    if state == "long_after":
+        time.sleep(ECHO_GRACE + 0.05)
+    return gate.evaluate(user_text).reason
+
+
+def main():
+    failures = 0
+    for agent_text, state, user_text, expected in CASES:
+        reason = run_case(agent_text, state, user_text)
+        ok = reason == expected
+        failures += not ok
+        last_line = agent_text.strip().splitlines()[-1]
+        print(f"{'✅' if ok else '❌'} {user_text!r:70s} -> {reason or 'pass':12s} ({state}, after {last_line[:40]!r})")
+        if not ok:
+            print(f"   expected {expected or 'pass'}")
+
+    print(f"\n{len(CASES) - failures}/{len(CASES)} cases as expected")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
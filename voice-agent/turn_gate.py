@@ -0,0 +1,196 @@
+"""Turn gating between STT and the LLM - drops noise, fillers and echo before they cost a completion"""
+
+import os
+import re
+import time
+from collections import deque
+
+# Sounds that are never an answer on their own
+FILLERS = {
+    "um", "umm", "uh", "uhh", "er", "erm", "ah", "ahh", "eh", "hm", "hmm", "mm", "mmm", "mhm", "oh",
+}
+
+# Acknowledgements that only carry meaning when the agent asked something
+BACKCHANNELS = {
+    "yeah", "yes", "yep", "yup", "ok", "okay", "right", "sure", "alright", "cool", "uh huh",
+    "mm hmm", "got it", "i see", "i see okay", "okay cool", "all right", "nice", "great",
+}
+
+_WORD_RE = re.compile(r"[a-z0-9@.']+")
+
+
+def is_backchannel(words):
+    """Whether the words are nothing but acknowledgements, e.g. 'okay sure' or 'yeah got it'"""
+    # reachable[i]: words[:i] splits into BACKCHANNELS phrases
+    reachable = [True] + [False] * len(words)
+    for end in range(1, len(words) + 1):
+        reachable[end] = any(
+            reachable[start] and ' '.join(words[start:end]) in BACKCHANNELS
+            for start in range(max(end - 3, 0), end)
+        )
+    return bool(words) and reachable[-1]
+
+
+def normalize(text):
+    """Lowercase words with punctuation and hyphens stripped"""
+    words = (w.strip(".'") for w in _WORD_RE.findall(text.lower().replace('-', ' ')))
+    return [w for w in words if w]
+
+
+class GateDecision:
+    __slots__ = ('suppressed', 'reason')
+
+    def __init__(self, suppressed, reason=None):
+        self.suppressed = suppressed
+        self.reason = reason
+
+
+PASS = GateDecision(False)
+
+
+class TurnGate:
+    """Decides whether a final transcript is a real user turn worth an LLM + TTS round trip.
+
+    A turn is suppressed when it is:
+      - filler: only filler sounds ("um", "uh, hmm")
+      - backchannel: an acknowledgement ("yeah", "okay") heard while the agent was
+        speaking or within echo_grace seconds after, when what it was saying had no
+        question in it. Once the agent has yielded the turn an "okay" is what moves
+        onboarding on, so it always passes
+      - echo: a verbatim run of at least echo_min_words the agent just said, heard
+        while the agent was speaking or within echo_grace seconds after it stopped
+      - too_short: less than min_chars of actual content (noise, stray syllables)
+
+    Echo is deliberately strict. Callers often repeat the agent's wording when they
+    answer or correct a confirmation ("Monday to Friday 9am to 6pm"), and a dropped
+    answer leaves them in silence, so anything short of a verbatim echo passes.
+
+    Savings are estimates: each suppressed turn is assumed to have cost one
+    completion of est_llm_tokens and one TTS reply of est_tts_chars.
+    """
+
+    def __init__(
+        self,
+        *,
+        min_chars: int = 2,
+        echo_window: float = 10.0,
+        echo_grace: float = 2.5,
+        echo_min_words: int = 4,
+        est_llm_tokens: int = 1500,
+        llm_usd_per_1k_tokens: float = 0.00006,
+        est_tts_chars: int = 150,
+        tts_usd_per_1k_chars: float = 0.015,
+        est_turn_latency: float = 1.5,
+    ):
+        self._min_chars = min_chars
+        self._echo_window = echo_window
+        self._echo_grace = echo_grace
+        self._echo_min_words = echo_min_words
+        self._est_llm_tokens = est_llm_tokens
+        self._llm_usd_per_1k_tokens = llm_usd_per_1k_tokens
+        self._est_tts_chars = est_tts_chars
+        self._tts_usd_per_1k_chars = tts_usd_per_1k_chars
+        self._est_turn_latency = est_turn_latency
+
+        self._agent_speech = deque()  # [updated_at, text, words] per agent utterance
+        self._agent_asked = True      # Treat the opening turn as an answer to the frontend's prompt
+        self._agent_speaking = False
+        self._agent_stopped_at = None  # When the agent last stopped speaking
+
+        self.passed = 0
+        self.suppressed = {"filler": 0, "backchannel": 0, "echo": 0, "too_short": 0}
+
+    def start_agent_speech(self):
+        """A new agent utterance is about to be synthesized"""
+        now = time.monotonic()
+        self._agent_speech.append([now, "", []])
+        self._prune(now)
+
+    def add_agent_speech(self, chunk):
+        """Text of the current utterance as it streams to TTS, i.e. before and while it plays"""
+        if not self._agent_speech:
+            self.start_agent_speech()
+        entry = self._agent_speech[-1]
+        entry[0] = time.monotonic()
+        entry[1] += chunk
+        entry[2] = normalize(entry[1])  # Re-split: chunks can end mid-word
+        # Replies often trail off after the question ("Do you have a website? Optional."),
+        # so any question counts - when unsure, let the turn through
+        self._agent_asked = '?' in entry[1]
+
+    def set_agent_speaking(self, speaking):
+        """Track the session's agent state; echo is only possible while or just after it speaks"""
+        if self._agent_speaking and not speaking:
+            self._agent_stopped_at = time.monotonic()
+        self._agent_speaking = speaking
+
+    def classify(self, text):
+        """Reason this transcript would be suppressed, or None - no counters are touched"""
+        words = normalize(text)
+        content = [w for w in words if w not in FILLERS]
+
+        if words and not content:
+            return "filler"
+        if sum(len(w) for w in content) < self._min_chars:
+            return "too_short"
+        if not self._agent_asked and self._overlaps_agent() and is_backchannel(content):
+            return "backchannel"
+        if self._is_echo(content):
+            return "echo"
+        return None
+
+    def evaluate(self, text):
+        """Classify a completed user turn and update the counters"""
+        reason = self.classify(text)
+        if reason is None:
+            self.passed += 1
+            return PASS
+        self.suppressed[reason] += 1
+        return GateDecision(True, reason)
+
+    def stats(self):
+        suppressed = sum(self.suppressed.values())
+        llm_tokens = suppressed * self._est_llm_tokens
+        tts_chars = suppressed * self._est_tts_chars
+        return {
+            "passed": self.passed,
+            "suppressed": suppressed,
+            "by_reason": dict(self.suppressed),
+            "est_llm_tokens_saved": llm_tokens,
+            "est_tts_chars_saved": tts_chars,
+            "est_cost_saved_usd": round(
+                llm_tokens / 1000 * self._llm_usd_per_1k_tokens + tts_chars / 1000 * self._tts_usd_per_1k_chars, 4
+            ),
+            "est_latency_saved_s": round(suppressed * self._est_turn_latency, 1),
+        }
+
+    def _is_echo(self, content):
+        # Short answers often repeat the agent's wording ("want to skip", "business name")
+        if len(content) < self._echo_min_words or not self._overlaps_agent():
+            return False
+        self._prune(time.monotonic())
+        # The whole turn must be a contiguous run of what the agent said
+        turn_text = ' ' + ' '.join(content) + ' '
+        return any(turn_text in ' ' + ' '.join(words) + ' ' for _, _, words in self._agent_speech)
+
+    def _overlaps_agent(self):
+        """Whether the agent is speaking or stopped less than echo_grace seconds ago"""
+        if self._agent_speaking:
+            return True
+        return self._agent_stopped_at is not None and time.monotonic() - self._agent_stopped_at <= self._echo_grace
+
+    def _prune(self, now):
+        while self._agent_speech and now - self._agent_speech[0][0] > self._echo_window:
+            self._agent_speech.popleft()
+
+
+def create_turn_gate():
+    """TurnGate configured from TURN_GATE_* environment variables"""
+    return TurnGate(
+        min_chars=int(os.getenv('TURN_GATE_MIN_CHARS', '2')),
+        echo_window=float(os.getenv('TURN_GATE_ECHO_WINDOW', '10')),
+        echo_grace=float(os.getenv('TURN_GATE_ECHO_GRACE', '2.5')),
+        echo_min_words=int(os.getenv('TURN_GATE_ECHO_MIN_WORDS', '4')),
+        est_llm_tokens=int(os.getenv('TURN_GATE_EST_LLM_TOKENS', '1500')),
+        est_turn_latency=float(os.getenv('TURN_GATE_EST_TURN_LATENCY', '1.5')),
+    )